@@ -7,8 +7,9 @@ import sys
 
 from lawhub.action import ReplaceAction, AddWordAction, DeleteAction
 from lawhub.apply import apply_replace, apply_add_word, apply_delete
+from lawhub.cache import get_default_cache
 from lawhub.constants import LOG_DATE_FORMAT, LOG_FORMAT
-from lawhub.law import LawNodeFinder, LawHierarchy, parse_xml_fp, extract_law_meta, save_law_tree
+from lawhub.law import LawNodeFinder, LawHierarchy, LawDocument, save_law_tree, diff_law_tree
 from lawhub.serializable import Serializable
 from lawhub.util import StatsFactory
 
@@ -52,16 +53,25 @@ def apply_gian(gian_fp, node_finder):
     return applied_actions, failed_actions, skipped_actions
 
 
-def main(law_fp, gian_fp, out_fp, stat_fp, applied_fp, failed_fp, skipped_fp):
+def to_offset_fp(fp):
+    return f'{fp}.offset'
+
+
+def main(law_fp, gian_fp, out_fp, before_fp, stat_fp, applied_fp, failed_fp, skipped_fp, diff_fp=None, save_offset=False):
     LOGGER.info(f'Start to parse {law_fp}')
     try:
-        meta = extract_law_meta(law_fp)
-        nodes = parse_xml_fp(law_fp)
+        document = LawDocument.from_xml_fp(law_fp, cache=get_default_cache())
     except Exception as e:
         msg = f'failed to parse {law_fp}: {e}'
         LOGGER.error(msg)
         sys.exit(1)
-    node_finder = LawNodeFinder(nodes)
+    node_finder = LawNodeFinder(document.nodes)
+    original_nodes = node_finder.snapshot()  # modified nodes are copied, so that original_nodes are kept unchanged
+
+    if before_fp:
+        # render with cache, so that only the modified articles are rendered again for out_fp
+        save_law_tree(document.meta['LawTitle'], original_nodes, before_fp, use_cache=True, offset_fp=to_offset_fp(before_fp) if save_offset else None)
+        LOGGER.info(f'Saved original law to {before_fp}')
 
     if gian_fp:
         LOGGER.info(f'Start to apply {gian_fp}')
@@ -94,22 +104,32 @@ def main(law_fp, gian_fp, out_fp, stat_fp, applied_fp, failed_fp, skipped_fp):
                     f.write(json.dumps(action.to_dict(), ensure_ascii=False) + '\n')
                 LOGGER.info(f'Saved failed actions to {skipped_fp}')
 
-    save_law_tree(meta['LawTitle'], nodes, out_fp)
+    save_law_tree(document.meta['LawTitle'], node_finder.nodes, out_fp, use_cache=True, offset_fp=to_offset_fp(out_fp) if save_offset else None)
     LOGGER.info(f'Saved result to {out_fp}')
 
+    if diff_fp:
+        changes = diff_law_tree(original_nodes, node_finder.nodes)
+        with open(diff_fp, 'w') as f:
+            for change in changes:
+                f.write(json.dumps(change.to_dict(), ensure_ascii=False) + '\n')
+        LOGGER.info(f'Saved {len(changes)} changed nodes to {diff_fp}')
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='JSON Lines形式にパースされた議案ファイル（.jsonl)および改正対象の法律ファイル（.xml）を受け取り、改正した法律をTXT形式で出力する')
     parser.add_argument('-g', '--gian', help='議案ファイル(.jsonl). 指定しない場合は改正せずに出力')
     parser.add_argument('-l', '--law', help='法律ファイル(.xml)', required=True)
     parser.add_argument('-o', '--out', help='出力ファイル(.txt)', required=True)
+    parser.add_argument('-b', '--before', help='改正前の法律を出力するファイル(.txt)')
     parser.add_argument('--applied', help='適用されたActionを保存する')
     parser.add_argument('--failed', help='適用されなかったActionを保存する')
     parser.add_argument('--skipped', help='飛ばされたActionを保存する')
+    parser.add_argument('-d', '--diff', help='改正前後で変更されたノードを保存する(.jsonl)')
+    parser.add_argument('--offset', action='store_true', help='出力した各ノードの位置を{出力ファイル}.offsetに保存する')
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-s', '--stat')
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, datefmt=LOG_DATE_FORMAT, format=LOG_FORMAT)
 
-    main(args.law, args.gian, args.out, args.stat, args.applied, args.failed, args.skipped)
+    main(args.law, args.gian, args.out, args.before, args.stat, args.applied, args.failed, args.skipped, args.diff, args.offset)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+"""
+lawhub-xmlの法令XMLを対象に、lawhub.lawの処理性能を計測するスクリプト
+"""
+
+import argparse
+import glob
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from collections import deque
+from pathlib import Path
+
+from tqdm import tqdm
+
+from lawhub.action import ReplaceAction, AddWordAction, DeleteAction
+from lawhub.apply import apply_replace, apply_add_word, apply_delete
+from lawhub.constants import LAWHUB_ROOT, LOG_DATE_FORMAT, LOG_FORMAT
+from lawhub.law import extract_text_from_sentence, Article, LawDocument, LawNodeFinder, Paragraph, save_law_tree
+from lawhub.lawtree import FlatLawTree
+from lawhub.query import Query
+from lawhub.xmlbackend import available_backends, get_backend
+
+LOGGER = logging.getLogger('benchmark_law')
+
+
+def find_xml_fps(directory, limit=None):
+    fps = sorted([Path(fp) for fp in glob.glob(f'{directory}/*/*.xml')])
+    return fps[:limit] if limit else fps
+
+
+def extract_text_from_sentence_by_tostring(node):
+    """
+    ET.tostringを用いた旧実装（比較用）
+    """
+    text = ET.tostring(node, encoding="unicode")
+    text = text.replace('\n', '')
+    text = re.sub(r'<Ruby>([^<>]*)<Rt>([^<>]*)</Rt></Ruby>', r'\1', text)
+    text = re.sub(r'<[^<>]*>', '', text)
+    return text.strip()
+
+
+def benchmark_sentence(xml_fps, disable_tqdm):
+    """
+    extract_text_from_sentenceを旧実装と比較する
+    """
+    count = 0
+    mismatch = 0
+    elapsed = {'tostring': 0.0, 'walk': 0.0}
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        sentences = ET.parse(fp).getroot().findall('.//Sentence')
+        count += len(sentences)
+
+        start = time.perf_counter()
+        expected = [extract_text_from_sentence_by_tostring(node) for node in sentences]
+        elapsed['tostring'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = [extract_text_from_sentence(node) for node in sentences]
+        elapsed['walk'] += time.perf_counter() - start
+
+        mismatch += sum(map(lambda x: x[0] != x[1], zip(expected, actual)))
+
+    LOGGER.info(f'extracted {count:,} sentences from {len(xml_fps):,} files ({mismatch:,} mismatches)')
+    for key, val in elapsed.items():
+        LOGGER.info(f'{key}: {val:.3f} sec')
+
+
+def benchmark_backend(xml_fps, disable_tqdm):
+    """
+    XmlBackendごとにLawDocumentの読み込み時間を比較し、同一の木が得られることを確認する
+    """
+    backends = [get_backend(name) for name in available_backends()]
+    elapsed = {backend.name: 0.0 for backend in backends}
+    mismatch = 0
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        results = []
+        for backend in backends:
+            start = time.perf_counter()
+            try:
+                document = LawDocument.from_xml_fp(fp, backend)
+            except Exception as e:
+                LOGGER.debug(f'failed to parse {fp} with {backend.name}: {e}')
+                document = None
+            elapsed[backend.name] += time.perf_counter() - start
+            results.append([node.serialize() for node in document.nodes] if document else None)
+        if any(map(lambda x: x != results[0], results[1:])):
+            LOGGER.warning(f'found different tree for {fp}')
+            mismatch += 1
+
+    LOGGER.info(f'parsed {len(xml_fps):,} files with {len(backends)} backends ({mismatch:,} mismatches)')
+    for key, val in elapsed.items():
+        LOGGER.info(f'{key}: {val:.3f} sec')
+
+
+def count_nodes(nodes):
+    count = 0
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def benchmark_memory(xml_fps, disable_tqdm):
+    """
+    全ての法令をひとつのプロセスに読み込み、ノードあたりのメモリ使用量を計測する
+    """
+    documents = []
+    tracemalloc.start()
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        try:
+            documents.append(LawDocument.from_xml_fp(fp))
+        except Exception as e:
+            LOGGER.debug(f'failed to parse {fp}: {e}')
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(map(lambda document: count_nodes(document.nodes), documents))
+    LOGGER.info(f'loaded {count:,} nodes from {len(documents):,} files')
+    LOGGER.info(f'current: {current:,} bytes ({current / max(count, 1):.1f} bytes/node)')
+    LOGGER.info(f'peak: {peak:,} bytes')
+
+
+def benchmark_flat(xml_fps, disable_tqdm):
+    """
+    全ての法令をFlatLawTreeとしてひとつのプロセスに読み込み、ノードあたりのメモリ使用量を計測する
+    """
+    trees = []
+    tracemalloc.start()
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        try:
+            trees.append(FlatLawTree.from_xml_fp(fp))
+        except Exception as e:
+            LOGGER.debug(f'failed to parse {fp}: {e}')
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(map(len, trees))
+    LOGGER.info(f'loaded {count:,} nodes from {len(trees):,} files')
+    LOGGER.info(f'current: {current:,} bytes ({current / max(count, 1):.1f} bytes/node)')
+    LOGGER.info(f'peak: {peak:,} bytes')
+
+
+def benchmark_render(xml_fps, disable_tqdm):
+    """
+    save_law_treeによる出力時間とピークメモリを計測する
+    """
+    documents = []
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        try:
+            documents.append(LawDocument.from_xml_fp(fp))
+        except Exception as e:
+            LOGGER.debug(f'failed to parse {fp}: {e}')
+
+    elapsed = 0.0
+    peak = 0
+    with tempfile.TemporaryDirectory() as directory:
+        out_fp = os.path.join(directory, 'out.txt')
+        for document in tqdm(documents, disable=disable_tqdm):
+            start = time.perf_counter()
+            save_law_tree(document.meta['LawTitle'], document.nodes, out_fp)
+            elapsed += time.perf_counter() - start
+        for document in tqdm(documents, disable=disable_tqdm):
+            tracemalloc.start()
+            save_law_tree(document.meta['LawTitle'], document.nodes, out_fp)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    LOGGER.info(f'rendered {len(documents):,} files')
+    LOGGER.info(f'elapsed: {elapsed:.3f} sec')
+    LOGGER.info(f'peak: {peak:,} bytes')
+
+
+def iter_paragraphs(nodes):
+    """
+    幅優先探索でnodes以下のParagraphを重複なく返す
+    """
+    visited = set()
+    q = deque(nodes)
+    while q:
+        node = q.popleft()
+        if id(node) in visited:
+            continue
+        visited.add(id(node))
+        if isinstance(node, Paragraph):
+            yield node
+        q.extend(node.children)
+
+
+def benchmark_rerender(xml_fps, disable_tqdm, edit_count=30):
+    """
+    キャッシュを用いて出力した後、edit_count個のParagraphを変更して再度出力する時間を計測する
+    """
+    documents = []
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        try:
+            documents.append(LawDocument.from_xml_fp(fp))
+        except Exception as e:
+            LOGGER.debug(f'failed to parse {fp}: {e}')
+
+    random.seed(0)
+    elapsed = {'first': 0.0, 'second': 0.0}
+    mismatch = 0
+    with tempfile.TemporaryDirectory() as directory:
+        out_fp = os.path.join(directory, 'out.txt')
+        expected_fp = os.path.join(directory, 'expected.txt')
+        for document in tqdm(documents, disable=disable_tqdm):
+            title = document.meta['LawTitle']
+            finder = LawNodeFinder(document.nodes)
+            start = time.perf_counter()
+            save_law_tree(title, document.nodes, out_fp, use_cache=True)
+            elapsed['first'] += time.perf_counter() - start
+
+            paragraphs = list(iter_paragraphs(finder.nodes))
+            for node in random.sample(paragraphs, min(edit_count, len(paragraphs))):
+                node.sentence += '（改正）'
+                finder.mark_dirty(node)
+            start = time.perf_counter()
+            save_law_tree(title, document.nodes, out_fp, use_cache=True)
+            elapsed['second'] += time.perf_counter() - start
+
+            save_law_tree(title, document.nodes, expected_fp)
+            with open(out_fp) as f1, open(expected_fp) as f2:
+                mismatch += f1.read() != f2.read()
+
+    LOGGER.info(f'rendered {len(documents):,} files twice ({mismatch:,} mismatches)')
+    for key, val in elapsed.items():
+        LOGGER.info(f'{key}: {val:.3f} sec')
+
+
+def benchmark_lazy(xml_fps, disable_tqdm, query_count=10):
+    """
+    lazy=Trueで読み込み、query_count個の条を検索する時間を通常の読み込みと比較する
+    索引（lawhub.xmlindex）はLAWHUB_DATA以下に保存したものを用いるため、初回は索引の作成時間を含む
+    """
+    random.seed(0)
+    elapsed = {'eager': 0.0, 'lazy': 0.0}
+    for fp in tqdm(xml_fps, disable=disable_tqdm):
+        for key, lazy in [('eager', False), ('lazy', True)]:
+            start = time.perf_counter()
+            try:
+                document = LawDocument.from_xml_fp(fp, lazy=lazy)
+            except Exception as e:
+                LOGGER.debug(f'failed to parse {fp}: {e}')
+                break
+            finder = LawNodeFinder(document.nodes)
+            titles = [node.title for node in finder.root_index.values() if isinstance(node, Article)]
+            for title in random.sample(titles, min(query_count, len(titles))):
+                for node in finder.find(Query.from_text(title)):
+                    str(node)
+            elapsed[key] += time.perf_counter() - start
+
+    LOGGER.info(f'parsed {len(xml_fps):,} files and searched {query_count} articles for each')
+    for key, val in elapsed.items():
+        LOGGER.info(f'{key}: {val:.3f} sec')
+
+
+def apply_by_count(action, node_finder):
+    """
+    in, count, replaceを用いた旧実装（比較用）
+    """
+    node = node_finder.find(action.at)[0]
+    if isinstance(action, ReplaceAction):
+        assert action.old in node.sentence and node.sentence.count(action.old) == 1
+        node.sentence = node.sentence.replace(action.old, action.new)
+    elif isinstance(action, AddWordAction):
+        assert action.word in node.sentence and node.sentence.count(action.word) == 1
+        idx = node.sentence.find(action.word) + len(action.word)
+        node.sentence = node.sentence[:idx] + action.what + node.sentence[idx:]
+    else:
+        for what in action.whats:
+            assert node.sentence.count(what) == 1
+        for what in action.whats:
+            node.sentence = node.sentence.replace(what, '')
+    node_finder.mark_dirty(node)
+
+
+def build_edit_actions(edit_count):
+    """
+    「語{i}」を含むParagraphと、それぞれの語を置換、追加、削除するedit_count個のActionを作成する
+    """
+    sentence = '、'.join(f'「語{i}」とは、法令で定めるものをいう' for i in range(edit_count)) + '。'
+    query = Query.from_text('第一条第一項')
+    actions = []
+    for i in random.sample(range(edit_count), edit_count):
+        word = f'「語{i}」'
+        if i % 3 == 0:
+            actions.append(ReplaceAction(text='', meta=None, at=query, old=word, new=f'「新語{i}」'))
+        elif i % 3 == 1:
+            actions.append(AddWordAction(text='', meta=None, at=query, word=word, what='（追加）'))
+        else:
+            actions.append(DeleteAction(text='', meta=None, at=query, whats=[word]))
+    return sentence, actions
+
+
+def benchmark_edit(xml_fps, disable_tqdm, edit_count=500, repeat=10):
+    """
+    ひとつのParagraphにedit_count個の改正を適用する時間を旧実装と比較する（xml_fpsは用いない）
+    """
+    random.seed(0)
+    sentence, actions = build_edit_actions(edit_count)
+    apply_functions = {ReplaceAction: apply_replace, AddWordAction: apply_add_word, DeleteAction: apply_delete}
+    elapsed = {'count': 0.0, 'find': 0.0}
+    results = {}
+    for _ in tqdm(range(repeat), disable=disable_tqdm):
+        for key in elapsed:
+            paragraph = Paragraph(number=1, sentence=sentence)
+            finder = LawNodeFinder([Article(title='第一条', children=[paragraph])])
+            start = time.perf_counter()
+            for action in actions:
+                if key == 'count':
+                    apply_by_count(action, finder)
+                else:
+                    apply_functions[type(action)](action, finder)
+            elapsed[key] += time.perf_counter() - start
+            results[key] = paragraph.sentence
+
+    LOGGER.info(f'applied {edit_count} edits to a sentence with {len(sentence):,} characters {repeat} times '
+                f'({"same" if results["count"] == results["find"] else "different"} results)')
+    for key, val in elapsed.items():
+        LOGGER.info(f'{key}: {val:.3f} sec')
+
+
+BENCHMARKS = {
+    'sentence': benchmark_sentence,
+    'backend': benchmark_backend,
+    'memory': benchmark_memory,
+    'flat': benchmark_flat,
+    'render': benchmark_render,
+    'rerender': benchmark_rerender,
+    'lazy': benchmark_lazy,
+    'edit': benchmark_edit,
+}
+
+
+def main(directory, tasks, limit, disable_tqdm):
+    xml_fps = find_xml_fps(directory, limit)
+    LOGGER.info(f'found {len(xml_fps)} xml files under {directory}')
+    for task in tasks:
+        LOGGER.info(f'start {task} benchmark')
+        BENCHMARKS[task](xml_fps, disable_tqdm)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='lawhub-xmlの法令XMLを対象にlawhub.lawの処理性能を計測する')
+    argparser.add_argument('-d', '--directory', default=LAWHUB_ROOT / 'lawhub-xml', help='lawhub-xmlのディレクトリ')
+    argparser.add_argument('-t', '--task', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS), help='実行するベンチマークを指定する')
+    argparser.add_argument('-n', '--limit', type=int, help='計測に用いるファイル数の上限')
+    argparser.add_argument('-v', '--verbose', action='store_true')
+    argparser.add_argument('--nobar', dest='disable_tqdm', action='store_true', help='プログレスバーを表示しない')
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, datefmt=LOG_DATE_FORMAT, format=LOG_FORMAT)
+    main(args.directory, args.task, args.limit, args.disable_tqdm)
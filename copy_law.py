@@ -7,40 +7,15 @@ import shutil
 import sys
 from pathlib import Path
 
-import pandas as pd
 from git import Repo
 
-from lawhub.constants import LAWHUB_ROOT, LOG_DATE_FORMAT, LOG_FORMAT
+from lawhub.constants import LOG_DATE_FORMAT, LOG_FORMAT
+from lawhub.fileutil import LawFinder
 from lawhub.law import extract_target_law_meta
 
 LOGGER = logging.getLogger('copy_law')
 
 
-class LawFinder:
-    LAWHUB_XML = LAWHUB_ROOT / 'lawhub-xml'
-
-    def __init__(self):
-        self.repo = Repo(self.LAWHUB_XML)
-        self.df = pd.read_csv(self.LAWHUB_XML / 'index.tsv', sep='\t')
-
-    def find_by_number(self, law_num):
-        query = f'LawNum == "{law_num}"'
-        return self.find_by_query(query)
-
-    def find_by_title(self, law_title):
-        query = f'LawTitle == "{law_title}"'
-        return self.find_by_query(query)
-
-    def find_by_query(self, query):
-        result = self.df.query(query)
-        if len(result) == 0:
-            raise ValueError(f'failed to find xml that match {query}')
-        elif len(result) == 1:
-            return self.LAWHUB_XML / result['fp'].iloc[0]
-        else:
-            raise ValueError(f'found multiple xml that match {query}: {result}')
-
-
 def main(jsonl_fp, out_fp):
     LOGGER.info(f'Start copying target of {jsonl_fp}')
 
@@ -71,7 +46,7 @@ def main(jsonl_fp, out_fp):
 
     meta_fp = str(out_fp) + '.meta'
     meta['fp'] = str(xml_fp)
-    meta['tag'] = str(law_finder.repo.tags[-1])
+    meta['tag'] = str(Repo(law_finder.directory).tags[-1])
     with open(meta_fp, 'w') as f:
         json.dump(meta, f, ensure_ascii=False)
     LOGGER.info(f'Saved meta data in {meta_fp}')
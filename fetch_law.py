@@ -4,13 +4,13 @@ import argparse
 import logging
 import sys
 import time
-import xml.etree.ElementTree as ET
 from pathlib import Path
 
 import requests
 
 from lawhub.constants import LOG_DATE_FORMAT, LOG_FORMAT
 from lawhub.law import extract_target_law_meta
+from lawhub.xmlbackend import BACKEND
 
 LOGGER = logging.getLogger('get_law')
 
@@ -25,7 +25,7 @@ def fetch_law(law_num):
     """
     url = f'https://elaws.e-gov.go.jp/api/1/lawdata/{law_num}'
     request = requests.get(url)
-    return ET.fromstring(request.text)
+    return BACKEND.fromstring(request.content)
 
 
 def main(jsonl_fp, xml_fp):
@@ -48,14 +48,13 @@ def main(jsonl_fp, xml_fp):
     try:
         root = fetch_law(meta['LawNum'])
         law = root.find('ApplData').find('LawFullText').find('Law')
-        tree = ET.ElementTree(law)
         time.sleep(1)
     except AttributeError as e:
         LOGGER.error(f'Failed to find Law: {e}')
         sys.exit(1)
     LOGGER.info(f'Fetched XML from e-Gov API')
 
-    tree.write(xml_fp, encoding='UTF-8')
+    BACKEND.write(law, xml_fp)
     LOGGER.info(f'Saved {xml_fp}')
 
 
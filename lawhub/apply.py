@@ -32,6 +32,20 @@ class MultipleTextFoundError(Exception):
         return f'found "{self.text}" multiple times in {self.query.text}'
 
 
+def find_unique_text(sentence, text, query):
+    """
+    sentence中のtextの位置を返す。textが見つからないか、重ならずに複数回現れる場合（sentence.count(text) > 1）は例外を投げる
+
+    in, count, replaceのようにsentenceを何度も走査せず、findを2回呼ぶだけで判定する
+    """
+    idx = sentence.find(text)
+    if idx < 0:
+        raise TextNotFoundError(text, query)
+    if not text or sentence.find(text, idx + len(text)) >= 0:
+        raise MultipleTextFoundError(text, query)
+    return idx
+
+
 def apply_replace(action, node_finder):
     assert isinstance(action, ReplaceAction)
     assert isinstance(node_finder, LawNodeFinder)
@@ -40,11 +54,12 @@ def apply_replace(action, node_finder):
         node = node_finder.find(action.at)[0]
     except Exception as e:
         raise NodeNotFoundError(action.at) from e
-    if not (hasattr(node, 'sentence')) or action.old not in node.sentence:
+    if not (hasattr(node, 'sentence')):
         raise TextNotFoundError(action.old, action.at)
-    if node.sentence.count(action.old) > 1:
-        raise MultipleTextFoundError(action.old, action.at)
-    node.sentence = node.sentence.replace(action.old, action.new)
+    idx = find_unique_text(node.sentence, action.old, action.at)
+    node = node_finder.copy_on_write(node)
+    node.sentence = node.sentence[:idx] + action.new + node.sentence[idx + len(action.old):]
+    node_finder.mark_dirty(node)
     LOGGER.debug(f'replaced \"{action.old}\" in {action.at} to \"{action.new}\"')
 
 
@@ -56,12 +71,12 @@ def apply_add_word(action, node_finder):
         node = node_finder.find(action.at)[0]
     except Exception as e:
         raise NodeNotFoundError(action.at) from e
-    if not (hasattr(node, 'sentence')) or action.word not in node.sentence:
+    if not (hasattr(node, 'sentence')):
         raise TextNotFoundError(action.word, action.at)
-    if node.sentence.count(action.word) > 1:
-        raise MultipleTextFoundError(action.word, action.at)
-    idx = node.sentence.find(action.word) + len(action.word)
+    idx = find_unique_text(node.sentence, action.word, action.at) + len(action.word)
+    node = node_finder.copy_on_write(node)
     node.sentence = node.sentence[:idx] + action.what + node.sentence[idx:]
+    node_finder.mark_dirty(node)
     LOGGER.debug(f'added \"{action.what}\" at {action.at}')
 
 
@@ -76,11 +91,9 @@ def apply_delete(action, node_finder):
     if not (hasattr(node, 'sentence')):
         raise TextNotFoundError('', action.at)
     for what in action.whats:
-        count = node.sentence.count(what)
-        if count == 0:
-            raise TextNotFoundError(what, action.at)
-        elif count > 1:
-            raise MultipleTextFoundError(what, action.at)
+        find_unique_text(node.sentence, what, action.at)
+    node = node_finder.copy_on_write(node)
     for what in action.whats:
         node.sentence = node.sentence.replace(what, '')
         LOGGER.debug(f'deleted \"{what}\" in {action.at}')
+    node_finder.mark_dirty(node)
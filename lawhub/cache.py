@@ -0,0 +1,179 @@
+"""
+パースした法令の木をファイルにキャッシュする
+
+キーはXMLファイルの内容とパーサー（パース結果が依存するモジュールを含む）のソースコードのSHA-256で、パーサーが変更されると古いキャッシュは削除される
+削除するのはキャッシュが作成した（MARKER_NAMEのファイルを含む）ディレクトリだけで、同じディレクトリにある他のデータは削除しない
+キャッシュはFlatLawTreeのバイナリ形式で保存し、合計サイズが上限を超えると最終利用日時の古いものから削除する
+"""
+
+import hashlib
+import importlib.metadata
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+from logging import getLogger
+from pathlib import Path
+
+import lawhub.constants
+import lawhub.law
+import lawhub.lawtree
+import lawhub.numeral
+import lawhub.xmlbackend
+from lawhub.constants import LAWHUB_DATA, LAWHUB_CACHE_SIZE
+from lawhub.law import LawDocument
+from lawhub.lawtree import FlatLawTree
+
+LOGGER = getLogger(__name__)
+META_HEADER = struct.Struct('<I')  # length of JSON encoded meta
+DEPENDENT_PACKAGES = ('kanjize', 'lxml')  # kanjize for titles of Paragraph, lxml for XmlBackend
+MARKER_NAME = '.lawtreecache'  # put in each directory of parser_version
+
+
+def compute_parser_version():
+    """
+    パーサーと、パース結果が依存するモジュールのソースコード、外部パッケージのバージョンからバージョン文字列を計算する
+    """
+    sha256 = hashlib.sha256()
+    for module in (lawhub.law, lawhub.lawtree, lawhub.numeral, lawhub.xmlbackend, lawhub.constants):
+        sha256.update(Path(module.__file__).read_bytes())
+    for package in DEPENDENT_PACKAGES:
+        try:
+            sha256.update(f'{package}=={importlib.metadata.version(package)}'.encode('utf-8'))
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    return sha256.hexdigest()[:16]
+
+
+PARSER_VERSION = compute_parser_version()
+
+
+class LawTreeCache:
+    """
+    LawDocumentをLAWHUB_DATA/cache/law/{parser_version}/以下に保存する
+    """
+
+    def __init__(self, directory=None, max_size=LAWHUB_CACHE_SIZE, parser_version=PARSER_VERSION):
+        self.root_directory = Path(directory) if directory else LAWHUB_DATA / 'cache' / 'law'
+        self.directory = self.root_directory / parser_version
+        self.max_size = max_size
+        self.parser_version = parser_version
+        self.hit_count = 0
+        self.miss_count = 0
+        self.total_size = None  # lazily computed
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / MARKER_NAME).touch()
+        self._remove_other_versions()
+
+    def load(self, xml_fp, backend=None):
+        """
+        xml_fpのLawDocumentをキャッシュから読み込む。キャッシュがなければパースして保存する
+        """
+        with open(xml_fp, 'rb') as f:
+            data = f.read()
+        key = self.compute_key(data)
+        cache_fp = self.directory / f'{key}.bin'
+
+        if cache_fp.exists():
+            try:
+                document = self.decode(cache_fp.read_bytes())
+                os.utime(cache_fp)  # update mtime for LRU
+                self.hit_count += 1
+                LOGGER.debug(f'loaded {xml_fp} from {cache_fp}')
+                return document
+            except Exception as e:
+                LOGGER.warning(f'failed to load cache {cache_fp}: {e}')
+
+        self.miss_count += 1
+        document = LawDocument.from_xml_fp(io.BytesIO(data), backend)
+        self._save(cache_fp, self.encode(document))
+        return document
+
+    def compute_key(self, data):
+        sha256 = hashlib.sha256()
+        sha256.update(self.parser_version.encode('utf-8'))
+        sha256.update(data)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def encode(document):
+        meta = json.dumps(document.meta, ensure_ascii=False).encode('utf-8')
+        return META_HEADER.pack(len(meta)) + meta + FlatLawTree.from_nodes(document.nodes).to_bytes()
+
+    @staticmethod
+    def decode(data):
+        size, = META_HEADER.unpack_from(data)
+        pos = META_HEADER.size
+        meta = json.loads(data[pos:pos + size].decode('utf-8'))
+        tree = FlatLawTree.from_bytes(memoryview(data)[pos + size:])
+        return LawDocument(meta=meta, nodes=tree.to_nodes())
+
+    def _save(self, cache_fp, data):
+        if len(data) > self.max_size:
+            LOGGER.debug(f'skip caching as data is larger than {self.max_size} bytes')
+            return
+        # write to temporary file and rename, so that other processes never read incomplete file
+        fd, tmp_fp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_fp, cache_fp)
+        except OSError as e:
+            LOGGER.warning(f'failed to save cache {cache_fp}: {e}')
+            if os.path.exists(tmp_fp):
+                os.remove(tmp_fp)
+            return
+        if self.total_size is None:
+            self.total_size = self._compute_total_size()
+        else:
+            self.total_size += len(data)
+        if self.total_size > self.max_size:
+            self._evict()
+
+    def _compute_total_size(self):
+        return sum(map(lambda fp: fp.stat().st_size, self.directory.glob('*.bin')))
+
+    def _evict(self):
+        """
+        合計サイズがmax_sizeの8割以下になるまで、最終利用日時の古いキャッシュから削除する
+        """
+        entries = []
+        for fp in self.directory.glob('*.bin'):
+            try:
+                stat = fp.stat()
+            except FileNotFoundError:  # removed by other process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fp))
+        entries.sort()
+
+        total_size = sum(map(lambda entry: entry[1], entries))
+        count = 0
+        for _, size, fp in entries:
+            if total_size <= self.max_size * 0.8:
+                break
+            try:
+                fp.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            count += 1
+        self.total_size = total_size
+        LOGGER.debug(f'evicted {count} cache files from {self.directory}')
+
+    def _remove_other_versions(self):
+        """
+        root_directory以下の、他のparser_versionのキャッシュのディレクトリを削除する（MARKER_NAMEのないディレクトリは残す）
+        """
+        for directory in self.root_directory.iterdir():
+            if directory.is_dir() and directory.name != self.parser_version and (directory / MARKER_NAME).exists():
+                shutil.rmtree(directory, ignore_errors=True)
+                LOGGER.info(f'removed outdated cache {directory}')
+
+
+def get_default_cache():
+    """
+    LAWHUB_CACHE_SIZEが0より大きければLawTreeCacheを返す
+    """
+    return LawTreeCache() if LAWHUB_CACHE_SIZE > 0 else None
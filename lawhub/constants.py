@@ -15,6 +15,9 @@ PATTERN_LAW_NUMBER = r'(?:{0})[{1}]+年(?:{2})第[{3}]+号'.format(
 )
 LAWHUB_ROOT = Path(os.environ['LAWHUB_ROOT']) if 'LAWHUB_ROOT' in os.environ else Path('/var/tmp')
 LAWHUB_DATA = Path(os.environ['LAWHUB_DATA']) if 'LAWHUB_DATA' in os.environ else Path('/var/tmp/data')
+LAWHUB_XML_BACKEND = os.environ['LAWHUB_XML_BACKEND'] if 'LAWHUB_XML_BACKEND' in os.environ else ''  # 'lxml' or 'etree', use lxml if installed by default
+LAWHUB_CACHE_SIZE = int(os.environ['LAWHUB_CACHE_SIZE']) if 'LAWHUB_CACHE_SIZE' in os.environ else 2 ** 30  # bytes, 0 to disable
+LAWHUB_STORE_SIZE = int(os.environ['LAWHUB_STORE_SIZE']) if 'LAWHUB_STORE_SIZE' in os.environ else 2 ** 28  # bytes of xml files kept parsed by LawStore
 LAWHUB_GITHUB_TOKEN = os.environ['LAWHUB_GITHUB_TOKEN'] if 'LAWHUB_GITHUB_TOKEN' in os.environ else ''
 LOG_DATE_FORMAT = "%Y-%m-%d %I:%M:%S"
 LOG_FORMAT = '%(asctime)s [%(name)s] %(levelname)s: %(message)s'
@@ -4,7 +4,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from lawhub.constants import LAWHUB_DATA
+from lawhub.constants import LAWHUB_DATA, LAWHUB_ROOT
 
 
 class GianDirectory:
@@ -35,3 +35,37 @@ class GianDirectory:
     def glob_fps(self, pattern):
         pattern = str(self.directory / pattern)
         return [Path(fp) for fp in glob.glob(pattern)]
+
+
+class LawFinder:
+    """
+    lawhub-xmlのindex.tsvから、LawNumまたはLawTitleに一致する法令のXMLファイルを探す
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else LAWHUB_ROOT / 'lawhub-xml'
+        self.df = pd.read_csv(self.directory / 'index.tsv', sep='\t', dtype=str)
+
+    def find_by_number(self, law_num):
+        return self.directory / self.find_record(law_num=law_num)['fp']
+
+    def find_by_title(self, law_title):
+        return self.directory / self.find_record(law_title=law_title)['fp']
+
+    def find_record(self, law_num=None, law_title=None):
+        """
+        LawNumまたはLawTitleに一致するindex.tsvの行を返す（一致する行がひとつでなければValueError）
+        """
+        if law_num is not None:
+            result = self.df[self.df['LawNum'] == law_num]
+            query = f'LawNum == "{law_num}"'
+        elif law_title is not None:
+            result = self.df[self.df['LawTitle'] == law_title]
+            query = f'LawTitle == "{law_title}"'
+        else:
+            raise ValueError('either law_num or law_title must be specified')
+        if len(result) == 0:
+            raise ValueError(f'failed to find xml that match {query}')
+        elif len(result) > 1:
+            raise ValueError(f'found multiple xml that match {query}: {result}')
+        return result.iloc[0]
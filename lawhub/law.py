@@ -1,17 +1,24 @@
+import copy
+import hashlib
+import os
 import re
-import xml.etree.ElementTree as ET
+import sys
 from collections import deque
 from enum import Enum
+from functools import lru_cache
+from itertools import chain
 from logging import getLogger
 
-from kanjize import int2kanji
-
 from lawhub.constants import NUMBER, NUMBER_KANJI, NUMBER_SUJI, NUMBER_ROMAN, IROHA, PATTERN_LAW_NUMBER
+from lawhub.numeral import int2kanji, title_to_sort_key, number_to_sort_key
 from lawhub.serializable import Serializable
+from lawhub.xmlbackend import BACKEND
+from lawhub.xmlindex import LawXmlIndex, SECTION_TAGS
 
 LOGGER = getLogger(__name__)
 SPACE = ' '
 INDENT = SPACE * 4
+DIGEST_SIZE = 16  # bytes of BaseLawClass.digest
 
 
 class LawHierarchy(Enum):
@@ -42,42 +49,18 @@ class LawHierarchy(Enum):
         :param allow_placeholder: '同条'という表現を許可する
         :param allow_partial_match: 部分一致を許可する
         """
-        if self == LawHierarchy.SUBITEM1:
-            pattern = r'[{0}]'.format(IROHA)
-        elif self == LawHierarchy.SUBITEM2:
-            pattern = r'\([{0}]+\)|（[{1}]+）'.format(NUMBER, NUMBER_SUJI)
-        elif self == LawHierarchy.SUBITEM3:
-            pattern = r'\([{0}]+\)|（[{0}]+）'.format(NUMBER_ROMAN)
-        elif self == LawHierarchy.SUBITEM4:
-            pattern = r'\([{0}]+\)|（[{0}]+）'.format(IROHA)
-        elif self in [LawHierarchy.SUPPLEMENT, LawHierarchy.CONTENTS, LawHierarchy.TABLE]:
-            pattern = self.value
-        else:
-            pattern = r'第[{0}]+{1}(の[{0}]+)*'.format(NUMBER_KANJI, self.value)
-            if allow_placeholder:
-                pattern += '|同{0}'.format(self.value)
-
-        if allow_partial_match:
-            m = re.search(pattern, string)
-        else:
-            m = re.fullmatch(pattern, string)
-        if m:
-            return m.group()
-        else:
-            return ''
+        pattern = HIERARCHY_PATTERNS[self, allow_placeholder]
+        m = pattern.search(string) if allow_partial_match else pattern.fullmatch(string)
+        return m.group() if m else ''
 
     def children(self, include_self=False):
-        flag = False
-        children = []
-        for hrchy in LawHierarchy:
-            if flag:
-                children.append(hrchy)
-            else:
-                if hrchy == self:
-                    flag = True
-                    if include_self:
-                        children.append(hrchy)
-        return children
+        return list(HIERARCHIES[self.rank if include_self else self.rank + 1:])
+
+    def child_mask(self, include_self=False):
+        """
+        childrenの各階層のrankのビットを立てた整数を返す
+        """
+        return ALL_HIERARCHY_MASK & ~((1 << (self.rank if include_self else self.rank + 1)) - 1)
 
     @staticmethod
     def from_text(text):
@@ -88,31 +71,185 @@ class LawHierarchy(Enum):
 
     @staticmethod
     def first():
-        return list(LawHierarchy)[0]
+        return HIERARCHIES[0]
 
     @staticmethod
     def last():
-        return list(LawHierarchy)[-1]
+        return HIERARCHIES[-1]
+
+
+HIERARCHIES = tuple(LawHierarchy)
+for _rank, _hrchy in enumerate(HIERARCHIES):
+    _hrchy.rank = _rank  # 0, 1, ... in hierarchy order
+ALL_HIERARCHY_MASK = (1 << len(HIERARCHIES)) - 1
+HIERARCHY_TO_ADDRESS_PREFIX = {
+    LawHierarchy.PART: 'Pt',
+    LawHierarchy.CHAPTER: 'Ch',
+    LawHierarchy.SECTION: 'Se',
+    LawHierarchy.SUBSECTION: 'Ss',
+    LawHierarchy.DIVISION: 'Dv',
+    LawHierarchy.ARTICLE: 'A',
+    LawHierarchy.PARAGRAPH: 'P',
+    LawHierarchy.ITEM: 'I',
+    LawHierarchy.SUBITEM1: 'Sa',
+    LawHierarchy.SUBITEM2: 'Sb',
+    LawHierarchy.SUBITEM3: 'Sc',
+    LawHierarchy.SUBITEM4: 'Sd',
+}
+ADDRESS_SEPARATOR = '/'
+
+
+def _hierarchy_pattern(hrchy, allow_placeholder):
+    if hrchy == LawHierarchy.SUBITEM1:
+        return r'[{0}]'.format(IROHA)
+    elif hrchy == LawHierarchy.SUBITEM2:
+        return r'\([{0}]+\)|（[{1}]+）'.format(NUMBER, NUMBER_SUJI)
+    elif hrchy == LawHierarchy.SUBITEM3:
+        return r'\([{0}]+\)|（[{0}]+）'.format(NUMBER_ROMAN)
+    elif hrchy == LawHierarchy.SUBITEM4:
+        return r'\([{0}]+\)|（[{0}]+）'.format(IROHA)
+    elif hrchy in [LawHierarchy.SUPPLEMENT, LawHierarchy.CONTENTS, LawHierarchy.TABLE]:
+        return hrchy.value
+    pattern = r'第[{0}]+{1}(?:の[{0}]+)*'.format(NUMBER_KANJI, hrchy.value)
+    if allow_placeholder:
+        pattern += '|同{0}'.format(hrchy.value)
+    return pattern
+
+
+def _combine_hierarchy_patterns(patterns):
+    """
+    (グループ名, パターン)の一覧を名前付きグループの選択としてまとめる（先に並べたものが優先される）
+    """
+    return re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in patterns))
+
+
+HIERARCHY_PATTERNS = {(hrchy, allow_placeholder): re.compile(_hierarchy_pattern(hrchy, allow_placeholder))
+                      for hrchy in LawHierarchy for allow_placeholder in (True, False)}
+HIERARCHY_CLASSIFIERS = {allow_placeholder: _combine_hierarchy_patterns((hrchy.name, _hierarchy_pattern(hrchy, allow_placeholder)) for hrchy in LawHierarchy)
+                         for allow_placeholder in (True, False)}
+GROUP_TO_HIERARCHY = {hrchy.name: hrchy for hrchy in LawHierarchy}
+PATTERN_ITEM_NUMBER = re.compile(r'[{0}]+(?:の[{0}]+)*'.format(NUMBER_KANJI))  # title of Item without 第 and 号
+# zero-width match at every position where some hierarchy matches, so that overlapping matches (e.g. 'イ' in '（イ）') are also found.
+# the patterns never match at the same position, as they differ in the first character or the character after the number.
+# the first lookahead lists the first characters of the patterns to skip other positions quickly
+HIERARCHY_SCANNER = re.compile('(?=[第同{0}(（{1}])(?={2})'.format(
+    ''.join(hrchy.value[0] for hrchy in [LawHierarchy.SUPPLEMENT, LawHierarchy.CONTENTS, LawHierarchy.TABLE]),
+    IROHA, HIERARCHY_CLASSIFIERS[True].pattern))
+PATTERN_ARTICLE_CAPTION = re.compile(r'(（.+）)')
+
+
+def classify_hierarchy(string, allow_placeholder=False, allow_partial_match=False):
+    """
+    文字列の階層と該当部分を(LawHierarchy, str)として返す。該当しなければ(None, '')を返す
+
+    完全一致では階層順で最初に一致する階層を、部分一致では最も左で一致する階層を返す
+    """
+    classifier = HIERARCHY_CLASSIFIERS[allow_placeholder]
+    m = classifier.search(string) if allow_partial_match else classifier.fullmatch(string)
+    return (GROUP_TO_HIERARCHY[m.lastgroup], m.group()) if m else (None, '')
+
+
+def extract_hierarchies(string):
+    """
+    全ての階層についてLawHierarchy.extract(string)の結果を文字列を一度走査して求め、一致した階層を階層順にdictで返す
+    """
+    found = dict()
+    for m in HIERARCHY_SCANNER.finditer(string):
+        if m.lastgroup not in found:
+            found[m.lastgroup] = m.group(m.lastgroup)
+    return {hrchy: found[hrchy.name] for hrchy in HIERARCHIES if hrchy.name in found}
 
 
 def extract_text_from_sentence(node):
-    text = ET.tostring(node, encoding="unicode")
-    text = text.replace('\n', '')
-    text = re.sub(r'<Ruby>([^<>]*)<Rt>([^<>]*)</Rt></Ruby>', r'\1', text)  # replace <Ruby>
-    text = re.sub(r'<[^<>]*>', '', text)  # replace all tags, such as <Sentence>
+    """
+    Sentence要素のテキストを返す。ルビ（Rt）は除去する
+
+    ET.tostringで文字列化してタグを除去した場合と同じ結果になるよう、
+    改行を除去し、&<>はエスケープしたまま残す
+    """
+    chunks = []
+    stack = [node]  # note that tostring() also outputs the tail of node
+    while stack:
+        elem = stack.pop()
+        if isinstance(elem, str):
+            chunks.append(elem)
+        elif _is_simple_ruby(elem):
+            chunks.append(elem.text or '')
+            chunks.append(elem.tail or '')
+        else:
+            chunks.append(elem.text or '')
+            stack.append(elem.tail or '')
+            stack.extend(reversed(elem))
+    text = ''.join(chunks).replace('\n', '')
+    if '&' in text or '<' in text or '>' in text:
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
     return text.strip()
 
 
-def extract_law_meta(xml_fp):
+def _is_simple_ruby(elem):
+    """
+    <Ruby>漢字<Rt>かんじ</Rt></Ruby>の形式であればTrueを返す（それ以外のRubyはRtも本文として扱う）
+    """
+    if elem.tag != 'Ruby' or elem.attrib or len(elem) != 1:
+        return False
+    rt = elem[0]
+    return rt.tag == 'Rt' and not rt.attrib and len(rt) == 0 and not (rt.tail or '').replace('\n', '')
+
+
+def extract_law_meta(xml_fp, backend=None):
     """
     LawのXMLファイルからメタデータを抽出する
+
+    LawNumとLawTitleは先頭付近にあるため、両方を読み込んだ時点で打ち切り、ファイル全体はパースしない
+    （そのためLawTitle以降のXMLの誤りは検出されない）
+    """
+    backend = backend if backend else BACKEND
+    f = xml_fp if hasattr(xml_fp, 'read') else open(xml_fp, 'rb')
+    try:
+        return _extract_law_meta(backend.iterparse(f, events=('start', 'end')))
+    finally:
+        if f is not xml_fp:
+            f.close()
+
+
+def _extract_law_meta(events):
     """
+    root.find('LawNum').text, root.find('LawBody').find('LawTitle').textと同じ要素を読む
+    """
+    attrib = None
+    law_num = law_title = None
+    found_law_num = found_law_title = False
+    law_body_state = 0  # 0: before the first LawBody, 1: in the first LawBody, 2: after the first LawBody
+    depth = 0
+    for event, elem in events:
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                assert elem.tag == 'Law'
+                attrib = dict(elem.attrib)
+            elif depth == 2 and elem.tag == 'LawBody' and law_body_state == 0:
+                law_body_state = 1
+            continue
+
+        if depth == 2:
+            if elem.tag == 'LawNum' and not found_law_num:
+                law_num = elem.text
+                found_law_num = True
+            elif elem.tag == 'LawBody' and law_body_state == 1:
+                law_body_state = 2
+        elif depth == 3 and law_body_state == 1 and elem.tag == 'LawTitle' and not found_law_title:
+            law_title = elem.text
+            found_law_title = True
+        depth -= 1
+        if found_law_num and (found_law_title or law_body_state == 2):
+            break
 
-    tree = ET.parse(xml_fp)
-    assert tree.getroot().tag == 'Law'
-    meta = {'LawNum': tree.find('LawNum').text,
-            'LawTitle': tree.find('LawBody').find('LawTitle').text}
-    meta.update(tree.getroot().attrib)
+    if not found_law_num:
+        raise ValueError('failed to find LawNum')
+    if not found_law_title:
+        raise ValueError('failed to find LawTitle')
+    meta = {'LawNum': law_num, 'LawTitle': law_title}
+    meta.update(attrib)
     return meta
 
 
@@ -131,93 +268,552 @@ def extract_target_law_meta(text):
     return meta
 
 
-def parse_xml_fp(xml_fp):
+def parse_xml_fp(xml_fp, backend=None, cache=None, lazy=False):
     """
     Lawのxmlファイルの本文をBaseLawClassに変換した結果を返す
     """
-    tree = ET.parse(xml_fp)
-    assert tree.getroot().tag == 'Law'
-    main = tree.find('LawBody').find('MainProvision')
-    return [parse_xml(node) for node in main]
+    return LawDocument.from_xml_fp(xml_fp, backend, cache, lazy).nodes
+
+
+def parse_article_xml_fp(xml_fp, number, index=None, backend=None):
+    """
+    LawのxmlファイルのうちMainProvisionのNum属性がnumberのArticleだけを読み込み、Articleに変換する
+
+    :param number: e-govのNum属性（例: '12_2'）
+    :param index: LawXmlIndex. 指定しない場合はLawXmlIndex.load_or_buildで取得する
+    """
+    index = index if index else LawXmlIndex.load_or_build(xml_fp)
+    return parse_xml_entry(xml_fp, index.find_article(number), backend)
+
+
+def parse_xml_entry(xml_fp, entry, backend=None):
+    """
+    LawXmlIndexのentryが示す範囲だけを読み込み、BaseLawClassに変換する
+    """
+    backend = backend if backend else BACKEND
+    return parse_xml(backend.fromstring(LawXmlIndex.read(xml_fp, entry)))
+
+
+class LawDocument:
+    """
+    Lawのxmlファイルのメタデータと本文をまとめて保持する
+
+    XmlBackend.iterparseで一度だけ読み込み、MainProvision以下の要素は終了タグに到達した時点でBaseLawClassに変換して破棄する
+    """
+
+    def __init__(self, meta, nodes):
+        self.meta = meta
+        self.nodes = nodes
+
+    @classmethod
+    def from_xml_fp(cls, xml_fp, backend=None, cache=None, lazy=False):
+        """
+        :param backend: XmlBackend to use. use lawhub.xmlbackend.BACKEND if not specified
+        :param cache: LawTreeCache to load parsed result from, if specified (not used if lazy)
+        :param lazy: LawXmlIndexから編・章・節・款・目と条の見出しだけを構築し、条の子ノードは参照された時点で読み込む
+        """
+        if lazy:
+            return cls.from_xml_index(xml_fp, backend=backend)
+        if cache:
+            return cache.load(xml_fp, backend)
+        backend = backend if backend else BACKEND
+        attrib = None
+        law_num = None
+        law_title = None
+        nodes = None
+        stack = []  # list of _XmlFrame from root to current element
+        skip_depth = 0  # depth from the first element whose state need not to be tracked
+        for event, elem in backend.iterparse(xml_fp, events=('start', 'end')):
+            if skip_depth:
+                skip_depth += 1 if event == 'start' else -1
+                continue
+            if event == 'start':
+                parent = stack[-1] if stack else None
+                if parent is not None and not parent.expand and parent.elem.tag not in ('Law', 'LawBody'):
+                    skip_depth = 1  # descendants are converted (or discarded) together with the parent
+                    continue
+                if parent is None:
+                    assert elem.tag == 'Law'
+                    attrib = dict(elem.attrib)
+                stack.append(_XmlFrame.open(elem, parent))
+                continue
+
+            frame = stack.pop()
+            parent = stack[-1] if stack else None
+            if frame.is_target:
+                parent.children.append(_build_node(elem, frame.children))
+                parent.elem.remove(elem)  # release consumed element
+            elif frame.is_main_provision:
+                nodes = frame.children
+            elif parent is not None and parent.elem.tag == 'Law' and elem.tag == 'LawNum' and law_num is None:
+                law_num = elem.text
+            elif parent is not None and parent.elem.tag == 'LawBody':
+                if elem.tag == 'LawTitle' and law_title is None:
+                    law_title = elem.text
+                parent.elem.remove(elem)  # release elements out of MainProvision, e.g. SupplProvision
+
+        if nodes is None:
+            raise ValueError(f'failed to find MainProvision in {xml_fp}')
+        meta = {'LawNum': law_num, 'LawTitle': law_title}
+        meta.update(attrib)
+        return cls(meta=meta, nodes=nodes)
+
+    @classmethod
+    def from_xml_index(cls, xml_fp, index=None, backend=None):
+        """
+        メタデータはextract_law_metaで、本文は索引から構築する
+        Articleは見出しだけを持ち、子ノードは索引のバイト範囲から読み込む（Article.is_lazyを参照）
+        編・章・節・款・目とArticle以外の要素（MainProvision直下のParagraphなど）はその場で読み込む
+
+        :param index: LawXmlIndex. 指定しない場合はLawXmlIndex.load_or_buildで取得する
+        """
+        backend = backend if backend else BACKEND
+        meta = extract_law_meta(xml_fp, backend)
+        index = index if index is not None else LawXmlIndex.load_or_build(xml_fp)
+        nodes = []
+        built = []  # BaseLawClass for each entry of the index
+        for entry in index.entries:
+            if entry.tag == 'Article':
+                node = Article(title=entry.title, caption=entry.caption, number=entry.num)
+                node._source = (xml_fp, index, entry, backend)
+            elif entry.tag in SECTION_TAGS:
+                node = XML_TAG_TO_CLASS[entry.tag](title=entry.title)
+            else:
+                node = parse_xml_entry(xml_fp, entry, backend)
+            if entry.parent < 0:
+                nodes.append(node)
+            else:
+                built[entry.parent].children.append(node)
+            built.append(node)
+        return cls(meta=meta, nodes=nodes)
+
+
+class _XmlFrame:
+    """
+    XmlBackend.iterparseで読み込み中の要素の状態を保持する
+    start eventの時点では子要素が揃っていることが保証されないため、子要素の数や先頭の要素名は自前で数える
+    """
+
+    __slots__ = ('elem', 'is_target', 'is_main_provision', 'expand', 'children', 'child_count', 'first_child_tag')
+
+    def __init__(self, elem, is_target, is_main_provision, expand):
+        self.elem = elem
+        self.is_target = is_target  # True if elem is converted to BaseLawClass
+        self.is_main_provision = is_main_provision
+        self.expand = expand  # True if child elements are converted to BaseLawClass
+        self.children = list()
+        self.child_count = 0
+        self.first_child_tag = None
+
+    @classmethod
+    def open(cls, elem, parent):
+        is_main_provision = elem.tag == 'MainProvision' and parent is not None and parent.elem.tag == 'LawBody'
+        is_target = False
+        if parent is not None:
+            if parent.child_count == 0:
+                parent.first_child_tag = elem.tag
+            parent.child_count += 1
+            if parent.expand:
+                is_target = parent.child_count > _count_xml_headers(parent.elem.tag, parent.first_child_tag)
+        expand = is_main_provision or (is_target and elem.tag in XML_TAG_TO_CLASS)
+        return cls(elem, is_target, is_main_provision, expand)
+
+
+def _count_xml_headers(tag, first_child_tag):
+    """
+    BaseLawClassの子ノードに変換しない先頭の要素（ArticleTitleなど）の数を返す
+    """
+    if tag == 'MainProvision':
+        return 0
+    elif tag == 'Article':
+        return 2 if first_child_tag == 'ArticleCaption' else 1
+    elif tag in ('Part', 'Chapter', 'Section', 'Subsection', 'Division'):
+        return 1
+    else:
+        return 2
 
 
 def parse_xml(node):
     """
-    XMLのnodeを与えられて、再帰的に子ノードまでBaseLawClassに変換した結果を返す
+    XMLのnodeを与えられて、子ノードまでBaseLawClassに変換した結果を返す
+    再帰呼び出しを避けるため、明示的なスタックを用いて帰りがけ順に変換する
 
     :param node: node in XML tree
     :return: node in BaseLawClass tree
     """
-    if node.tag == 'Part':
-        return Part.from_xml(node)
-    elif node.tag == 'Chapter':
-        return Chapter.from_xml(node)
-    elif node.tag == 'Section':
-        return Section.from_xml(node)
-    elif node.tag == 'Subsection':
-        return Subsection.from_xml(node)
-    elif node.tag == 'Division':
-        return Division.from_xml(node)
-    elif node.tag == 'Article':
-        return Article.from_xml(node)
-    elif node.tag == 'Paragraph':
-        return Paragraph.from_xml(node)
-    elif node.tag == 'Item':
-        return Item.from_xml(node)
-    elif node.tag == 'Subitem1':
-        return Subitem1.from_xml(node)
-    elif node.tag == 'Subitem2':
-        return Subitem2.from_xml(node)
-    elif node.tag == 'Subitem3':
-        return Subitem3.from_xml(node)
-    elif node.tag == 'Subitem4':
-        return Subitem4.from_xml(node)
-    elif node.tag == 'TableStruct':
-        return BaseLawClass(title='<表略>')
-    elif node.tag == 'List':
-        return BaseLawClass(title='<一覧略>')
-    elif node.tag == 'FigStruct':
-        return BaseLawClass(title='<図略>')
-    elif node.tag == 'AmendProvision':
-        return BaseLawClass(title='<修正略>')
-    elif node.tag == 'SupplNote':
-        return BaseLawClass(title='<注釈略>')
+    results = []
+    stack = [(node, False)]
+    while stack:
+        elem, visited = stack.pop()
+        if visited:
+            count = len(elem) - _count_xml_headers(elem.tag, elem[0].tag) if elem.tag in XML_TAG_TO_CLASS else 0
+            children = results[len(results) - count:]
+            del results[len(results) - count:]
+            results.append(_build_node(elem, children))
+        else:
+            stack.append((elem, True))
+            if elem.tag in XML_TAG_TO_CLASS:
+                stack.extend((child, False) for child in reversed(elem[_count_xml_headers(elem.tag, elem[0].tag):]))
+    return results[0]
+
+
+def _read_lazy_children(xml_fp, index, entry, backend):
+    """
+    索引のentryが示す範囲のArticleを読み込み、その子ノードを返す
+    索引を取得した後にXMLファイルが更新された場合はバイト範囲が正しくないため、ValueErrorを送出する
+    """
+    stat = os.stat(xml_fp)
+    if (stat.st_size, stat.st_mtime_ns) != (index.size, index.mtime):
+        raise ValueError(f'{xml_fp} is modified after loaded lazily')
+    return parse_xml_entry(xml_fp, entry, backend).children
+
+
+def _build_node(node, children):
+    """
+    子ノードを変換済みのXMLのnodeをBaseLawClassに変換する
+    """
+    if node.tag in XML_TAG_TO_CLASS:
+        return XML_TAG_TO_CLASS[node.tag].from_xml(node, children)
+    elif node.tag in XML_TAG_TO_PLACEHOLDER:
+        return BaseLawClass(title=XML_TAG_TO_PLACEHOLDER[node.tag])
     else:
         LOGGER.warning(f'Unknown Element {node.tag}: {node}')
         return BaseLawClass(title=f'<{node.tag}略>')
 
 
-def save_law_tree(law_title, nodes, fp):
+def save_law_tree(law_title, nodes, fp, buffer_size=2 ** 13, use_cache=False, offset_fp=None):
+    """
+    法令をTEXT形式で保存する。出力はbuffer_size文字程度ずつまとめて書き込む
+
+    :param use_cache: iter_law_tree_textを参照
+    :param offset_fp: 指定した場合、各ノードのアドレスと出力中の位置をTSVで保存する（save_law_tree_offsetsを参照）
+    """
+    header = f'{law_title}\n\n'
     with open(fp, 'w') as f:
-        f.write(f'{law_title}\n\n')
-        for node in nodes:
-            f.write(f'{node}\n')
+        f.write(header)
+        buffer = []
+        length = 0
+        offsets = []
+        if offset_fp:
+            chunks = iter_law_tree_text_with_offsets(nodes, offsets, header, use_cache)
+        else:
+            chunks = (text for node in nodes for text in chain(iter_law_tree_text(node, use_cache), '\n'))
+        for text in chunks:
+            buffer.append(text)
+            length += len(text)
+            if length >= buffer_size:
+                f.write(''.join(buffer))
+                buffer.clear()
+                length = 0
+        f.write(''.join(buffer))
+    if offset_fp:
+        save_law_tree_offsets(offsets, offset_fp)
+
+
+def iter_law_tree_text_with_offsets(nodes, offsets, header='', use_cache=False):
+    """
+    save_law_treeが本文として出力する文字列を先頭から少しずつ返し、各ノードの出力中の位置をoffsetsに追加する
+
+    offsetsには(アドレス, 開始行, 終了行, 開始バイト, 終了バイト)を文書順（親ノードを子ノードより先）に追加する
+    行は1から数えて終了行を含み（ノードの末尾の改行は含まない）、バイトは終了位置を含まない。いずれもheaderを含めて数える
+
+    :param use_cache: iter_law_tree_textを参照。Articleの文字列とともに、Article内のノードの相対的な位置もキャッシュする
+    """
+    items = [(address, node, '\n') for address, node in _iter_unique_keys(nodes)]
+    return _iter_text_with_offsets(items, offsets, header, use_cache)
+
+
+def _iter_text_with_offsets(items, offsets, header, use_cache):
+    """
+    :param items: list of (address, node, suffix). suffix is written after the node
+    """
+    state = _TextPosition().advance(header)
+    # list of (node, prefix, address). node is None to write prefix and then close the node if address is (index in offsets, address)
+    stack = []
+    for address, node, suffix in reversed(items):
+        stack.append((None, suffix, None))
+        stack.append((node, '', address))
+    while stack:
+        item, prefix, address = stack.pop()
+        if prefix:
+            yield prefix
+            state.advance(prefix)
+        if item is None:
+            if address is not None:
+                idx, address = address
+                _, start_line, _, start_pos, _ = offsets[idx]
+                offsets[idx] = (address, start_line, max(state.line - state.trailing + 1, start_line), start_pos, state.pos)
+            continue
+        if use_cache and item._cache_text:
+            if item._offsets is None:
+                relative_offsets = []
+                item._text = ''.join(_iter_text_with_offsets([('', item, '')], relative_offsets, '', use_cache=False))
+                item._offsets = relative_offsets
+            # positions relative to the start of the node are shifted as is, even for the end line
+            # because the end line is determined by the start line while only '\n' is written from the start of the node
+            line, pos = state.line, state.pos
+            offsets.extend((address + relative_address, line + start_line, line + end_line, pos + start_pos, pos + end_pos)
+                           for relative_address, start_line, end_line, start_pos, end_pos in item._offsets)
+            yield item._text
+            state.advance(item._text)
+            continue
+        # reserve the record to keep document order, and fill the end position on closing the node
+        idx = len(offsets)
+        offsets.append((address, state.line + 1, None, state.pos, None))
+        children = item.children
+        stack.append((None, item._str_tail, (idx, address)))
+        if children:
+            stack.append((None, item._str_head() + item._str_separator, None))
+            child_address = address + ADDRESS_SEPARATOR
+            items = [(child, '\n' if i > 0 else '', child_address + key) for i, (key, child) in enumerate(_iter_unique_keys(children))]
+            items.reverse()
+            stack[-1:-1] = items
+        else:
+            stack.append((None, item._str_head(), None))
+
+
+class _TextPosition:
+    """
+    出力した文字列の行数、バイト数、末尾の連続する改行の数
+    """
+
+    __slots__ = ('line', 'pos', 'trailing')
+
+    def __init__(self):
+        self.line = 0  # number of '\n' written so far
+        self.pos = 0
+        self.trailing = 0  # number of '\n' at the end of written text
+
+    def advance(self, text):
+        self.line += text.count('\n')
+        self.pos += len(text.encode('utf-8'))
+        stripped = len(text.rstrip('\n'))
+        self.trailing = self.trailing + len(text) if stripped == 0 else len(text) - stripped
+        return self
+
+
+def save_law_tree_offsets(offsets, fp):
+    """
+    iter_law_tree_text_with_offsetsのoffsetsをTSVで保存する
+    """
+    with open(fp, 'w') as f:
+        f.write('address\tstart_line\tend_line\tstart_byte\tend_byte\n')
+        for record in offsets:
+            f.write('\t'.join(map(str, record)) + '\n')
+
+
+def load_law_tree_offsets(fp):
+    """
+    save_law_tree_offsetsで保存したTSVを読み込み、アドレスから(開始行, 終了行, 開始バイト, 終了バイト)へのdictを返す
+    """
+    offsets = dict()
+    with open(fp) as f:
+        next(f)
+        for line in f:
+            address, *values = line.rstrip('\n').split('\t')
+            offsets[address] = tuple(map(int, values))
+    return offsets
+
+
+def iter_law_tree_text(node, use_cache=False):
+    """
+    str(node)と同じ文字列を先頭から少しずつ返す
+
+    ノードごとに部分木の文字列を組み立てると階層の数だけ文字列がコピーされるため、明示的なスタックを用いて文書順に出力する
+    各ノードは「_str_head() + _str_separator + 子ノード（改行区切り） + _str_tail」として出力される
+
+    :param use_cache: Articleの部分木の文字列をキャッシュし、次回以降の出力で再利用する。
+        キャッシュしたノードの子孫を変更した場合はclear_cacheを呼ぶ必要がある（LawNodeFinder.mark_dirtyを参照）
+    """
+    stack = [(node, '')]  # list of (node, prefix). node is None for _str_tail of parent node
+    while stack:
+        item, prefix = stack.pop()
+        if item is None:
+            yield prefix
+            continue
+        if use_cache and item._cache_text:
+            if item._text is None:
+                item._text = ''.join(iter_law_tree_text(item))
+            yield prefix + item._text
+            continue
+        children = item.children
+        if children:
+            yield prefix + item._str_head() + item._str_separator
+            if item._str_tail:
+                stack.append((None, item._str_tail))
+            for i in range(len(children) - 1, 0, -1):
+                stack.append((children[i], '\n'))
+            stack.append((children[0], ''))
+        else:
+            yield prefix + item._str_head() + item._str_tail
 
 
 def sort_law_tree(node):
+    """
+    条と項を番号順に並べ替える。並べ替えたノードとその祖先のキャッシュを破棄し、部分木が変わったかを返す
+    """
+    changed = False
     for child in node.children:
-        sort_law_tree(child)
+        changed = sort_law_tree(child) or changed
     for sortable_class in [Article, Paragraph]:
         if all(map(lambda x: isinstance(x, sortable_class), node.children)):
+            children = list(node.children)
             node.children.sort()
+            changed = changed or any(map(lambda x: x[0] is not x[1], zip(children, node.children)))
             break
+    if changed:
+        node.clear_cache()
+    return changed
+
+
+def law_tree_digest(nodes):
+    """
+    法令の本文（最上位のノードのlist）全体のdigestを返す
+    """
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for node in nodes:
+        h.update(node.digest())
+    return h.digest()
+
+
+@lru_cache(maxsize=2 ** 16)
+def _format_address_key(hierarchy, number, title):
+    """
+    :param number: Articleの場合はNum属性、それ以外はsort_key
+    """
+    prefix = HIERARCHY_TO_ADDRESS_PREFIX.get(hierarchy, '')
+    if isinstance(number, str):
+        return prefix + number
+    elif number:
+        return prefix + '_'.join(map(str, number))
+    return prefix + title.replace(ADDRESS_SEPARATOR, '／')
+
+
+def build_address_index(nodes):
+    """
+    木の全てのノードについて、最上位からkeyを'/'で連結したアドレス（例: 'Ch2/A12_2/P3/I5'）をキーとするdictを返す
+
+    アドレスはXMLのNum属性やtitleから決まるため、同じ法令の別の版でも同じノードは同じアドレスとなる
+    同じ親の子ノードでkeyが重複する場合は、2番目以降のkeyに'~2', '~3', ...を付ける
+    """
+    index = dict()
+    stack = [(nodes, '')]
+    while stack:
+        children, prefix = stack.pop()
+        for key, node in _iter_unique_keys(children):
+            address = prefix + key
+            index[address] = node
+            if node.children:
+                stack.append((node.children, address + ADDRESS_SEPARATOR))
+    return index
+
+
+def _iter_unique_keys(nodes):
+    counter = dict()
+    for node in nodes:
+        key = node.key
+        count = counter.get(key, 0) + 1
+        counter[key] = count
+        yield (key if count == 1 else f'{key}~{count}'), node
+
+
+def _compute_digest(node):
+    """
+    digestが未計算のノードについて、明示的なスタックを用いて帰りがけ順に計算する
+    """
+    stack = [(node, False)]
+    while stack:
+        item, visited = stack.pop()
+        if visited:
+            h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+            h.update(item.__class__.__name__.encode('utf-8'))
+            for field in item._digest_fields():
+                data = str(field).encode('utf-8')
+                h.update(len(data).to_bytes(4, 'little'))
+                h.update(data)
+            for child in item.children:
+                h.update(child._digest)
+            item._digest = h.digest()
+        elif item._digest is None:
+            stack.append((item, True))
+            stack.extend((child, False) for child in item.children)
 
 
 class BaseLawClass(Serializable):
+    """
+    法令の木構造のノード
+
+    法令全体を読み込むとノード数が膨大になるため、__slots__で属性を固定し、
+    '第一項'のように繰り返し現れるtitleはsys.internで共有する
+    sort_keyは'第十二条の二'に対する(12, 2)のような番号のtupleで、生成時に計算する（同じ番号のtupleは共有される）
+    digestは内容と子ノードのdigestから計算するハッシュ値で、部分木が同一かどうかを子孫を辿らずに比較できる
+    """
+
+    __slots__ = ('title', 'children', '_sort_key', '_digest')
     hierarchy = None
+    _str_separator = '\n'  # between _str_head() and children
+    _str_tail = ''
+    _cache_text = False  # see iter_law_tree_text
 
     def __init__(self, title=None, children=None):
-        self.title = title if title else ''
+        self.title = sys.intern(title) if title else ''
         self.children = children if children else list()
+        self._sort_key = self._compute_sort_key()
+        self._digest = None
+
+    @property
+    def sort_key(self):
+        return self._sort_key
+
+    @property
+    def key(self):
+        """
+        同じ親の子ノードの中でノードを識別する文字列（例: 第十二条の二は'A12_2'、第三項は'P3'）
+        番号を持たないノードはtitleを用いる。ノードの位置を表すアドレスはbuild_address_indexを参照
+        """
+        return _format_address_key(self.hierarchy, self._sort_key, self.title)
+
+    def _compute_sort_key(self):
+        return title_to_sort_key(self.title)
+
+    def is_lazy(self):
+        """
+        子ノードが未読み込みであればTrueを返す（Articleを参照）
+        """
+        return False
+
+    def digest(self):
+        """
+        title, caption, sentenceなどの内容と子ノードのdigestから計算したハッシュ値（bytes）を返す
+        計算結果はキャッシュされるため、子孫を変更した場合はclear_cacheを呼ぶ必要がある（LawNodeFinder.mark_dirtyを参照）
+        """
+        if self._digest is None:
+            _compute_digest(self)
+        return self._digest
+
+    def _digest_fields(self):
+        return self.title,
+
+    def copy(self):
+        """
+        子ノードのlistだけを複製した浅いコピーを返す（子ノードは共有し、キャッシュは引き継がない）
+        """
+        node = copy.copy(self)
+        node.children = list(self.children)
+        node.clear_cache()
+        return node
+
+    def clear_cache(self):
+        """
+        iter_law_tree_textでキャッシュした文字列とdigestを破棄する
+        """
+        self._digest = None
 
     def __str__(self):
-        body = self.title
-        if self.children:
-            body += '\n' + self.__str_children__()
-        return body
+        return ''.join(iter_law_tree_text(self))
 
-    def __str_children__(self):
-        return '\n'.join(map(lambda x: x.__str__(), self.children))
+    def _str_head(self):
+        return self.title
 
     def __repr__(self):
         return f'<{self.__class__.__name__} {self.title}>'
@@ -227,148 +823,192 @@ class BaseLawClass(Serializable):
 
 
 class BaseSectionClass(BaseLawClass):
+    __slots__ = ()
+
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         title = node[0].text
-        children = [parse_xml(child) for child in node[1:]]
+        if children is None:
+            children = [parse_xml(child) for child in node[1:]]
         return cls(title=title, children=children)
 
-    def __str__(self):
-        return super().__str__() + '\n'
+    _str_tail = '\n'
 
 
 class Part(BaseSectionClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.PART
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Part'
         assert node[0].tag == 'PartTitle'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
 
 class Chapter(BaseSectionClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.CHAPTER
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Chapter'
         assert node[0].tag == 'ChapterTitle'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
 
 class Section(BaseSectionClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.SECTION
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Section'
         assert node[0].tag == 'SectionTitle'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
 
 class Subsection(BaseSectionClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.SUBSECTION
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Subsection'
         assert node[0].tag == 'SubsectionTitle'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
 
 class Division(BaseSectionClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.DIVISION
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Division'
         assert node[0].tag == 'DivisionTitle'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
 
 class Article(BaseLawClass):
+    """
+    LawDocument.from_xml_fp(lazy=True)で生成した場合は索引のエントリを保持し、childrenを初めて参照した時点で子ノードを読み込む
+    """
+
+    __slots__ = ('caption', 'number', '_text', '_offsets', '_source')
     hierarchy = LawHierarchy.ARTICLE
+    _cache_text = True
 
     def __init__(self, title=None, caption=None, number=None, children=None):
-        super().__init__(title, children)
         self.caption = caption if caption else ''
-        self.number = number if number else '1'
+        if not number:  # e.g. built by line_to_law_node, use number in title instead of Num attribute
+            number = '_'.join(map(str, title_to_sort_key(title))) or '1'
+        self.number = sys.intern(number)
+        self._text = None
+        self._offsets = None  # see iter_law_tree_text_with_offsets
+        self._source = None  # (xml_fp, LawXmlIndex, XmlIndexEntry, XmlBackend) to read children from
+        super().__init__(title, children)
+
+    @property
+    def children(self):
+        if self._source is not None:
+            self.children = _read_lazy_children(*self._source)
+        return BaseLawClass.children.__get__(self)
+
+    @children.setter
+    def children(self, children):
+        self._source = None
+        BaseLawClass.children.__set__(self, children)
+
+    def is_lazy(self):
+        return self._source is not None
+
+    def clear_cache(self):
+        super().clear_cache()
+        self._text = None
+        self._offsets = None
+
+    def _digest_fields(self):
+        return self.title, self.caption, self.number
+
+    def _compute_sort_key(self):
+        return number_to_sort_key(self.number)
+
+    @property
+    def key(self):
+        return _format_address_key(self.hierarchy, self.number, self.title)  # use Num attribute such as '226:227'
 
     def is_caption_only(self):
         return self.title == '' and self.caption != ''
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Article'
         assert 'Num' in node.attrib
         number = node.attrib['Num']
         if node[0].tag == 'ArticleCaption' and node[1].tag == 'ArticleTitle':
             caption = node[0].text
             title = node[1].text
-            children = [parse_xml(child) for child in node[2:]]
+            child_nodes = node[2:]
         elif node[0].tag == 'ArticleTitle':
             caption = None
             title = node[0].text
-            children = [parse_xml(child) for child in node[1:]]
+            child_nodes = node[1:]
         else:
             assert False
+        if children is None:
+            children = [parse_xml(child) for child in child_nodes]
         return cls(title=title, caption=caption, number=number, children=children)
 
-    def __str__(self):
-        body = self.caption + '\n' + self.title if self.caption else self.title
-        if self.children:
-            body += SPACE + self.__str_children__()
-        return body + '\n'
+    _str_separator = SPACE
+    _str_tail = '\n'
+
+    def _str_head(self):
+        return self.caption + '\n' + self.title if self.caption else self.title
 
     def __eq__(self, other):
         return isinstance(other, Article) and self.title == other.title and self.caption == other.caption and self.number == other.number
 
     def __lt__(self, other):
-        def clean(number):
-            return re.sub(r'[^0-9]', '_', number)  # adhoc fix to handle '226:227' in 昭和二十五年法律第二百三十九号
-
         if not isinstance(other, Article):
             raise NotImplementedError(f'can not compare \"{type(other)}\" with Article')
-
-        for i, j in zip(map(lambda x: int(x), clean(self.number).split('_')),
-                        map(lambda x: int(x), clean(other.number).split('_'))):
-            if i < j:
-                return True
-            elif i > j:
-                return False
-        return len(self.number) < len(other.number)
+        return (self.sort_key, len(self.number)) < (other.sort_key, len(other.number))
 
 
 class Paragraph(BaseLawClass):
+    __slots__ = ('number', 'sentence')
     hierarchy = LawHierarchy.PARAGRAPH
 
     def __init__(self, title=None, number=None, sentence=None, children=None):
         if (not title) and number:
             title = '第{}項'.format(int2kanji(int(number)))
-        super().__init__(title, children)
         self.number = number if number else 1
         self.sentence = sentence if sentence else ''
+        super().__init__(title, children)
+
+    def _compute_sort_key(self):
+        return number_to_sort_key(str(self.number))
+
+    def _digest_fields(self):
+        return self.title, self.number, self.sentence
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Paragraph'
         assert node[0].tag == 'ParagraphNum'
         assert node[1].tag == 'ParagraphSentence'
         assert 'Num' in node.attrib
         number = int(node.attrib['Num'])
         sentence = ''.join(map(lambda n: extract_text_from_sentence(n), node[1].findall('.//Sentence')))
-        children = [parse_xml(child) for child in node[2:]]
+        if children is None:
+            children = [parse_xml(child) for child in node[2:]]
         return cls(number=number, sentence=sentence, children=children)
 
-    def __str__(self):
+    def _str_head(self):
         if self.number == 1:
-            body = self.sentence
+            return self.sentence
         else:
-            body = str(self.number) + SPACE + self.sentence
-        if self.children:
-            body += '\n' + self.__str_children__()
-        return body
+            return str(self.number) + SPACE + self.sentence
 
     def __eq__(self, other):
         return isinstance(other, Paragraph) and self.title == other.title and self.number == other.number and self.sentence == other.sentence
@@ -376,26 +1016,29 @@ class Paragraph(BaseLawClass):
     def __lt__(self, other):
         if not isinstance(other, Paragraph):
             raise NotImplementedError(f'can not compare \"{type(other)}" with Paragraph')
-        return self.number < other.number
+        return self.sort_key < other.sort_key
 
 
 class BaseItemClass(BaseLawClass):
+    __slots__ = ('sentence',)
+
     def __init__(self, title=None, sentence=None, children=None):
         super().__init__(title, children)
         self.sentence = sentence if sentence else ''
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         title = node[0].text
         sentence = INDENT.join(map(lambda n: extract_text_from_sentence(n), node[1].findall('.//Sentence')))
-        children = [parse_xml(child) for child in node[2:]]
+        if children is None:
+            children = [parse_xml(child) for child in node[2:]]
         return cls(title=title, sentence=sentence, children=children)
 
-    def __str__(self):
-        body = self.title + SPACE + self.sentence
-        if self.children:
-            body += '\n' + self.__str_children__()
-        return body
+    def _str_head(self):
+        return self.title + SPACE + self.sentence
+
+    def _digest_fields(self):
+        return self.title, self.sentence
 
     def __repr__(self):
         return f'<{self.__class__.__name__} {self.title} {self.sentence}>'
@@ -405,6 +1048,7 @@ class BaseItemClass(BaseLawClass):
 
 
 class Item(BaseItemClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.ITEM
 
     def __init__(self, title=None, sentence=None, children=None):
@@ -413,112 +1057,150 @@ class Item(BaseItemClass):
         super().__init__(title, sentence, children)
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Item'
         assert node[0].tag == 'ItemTitle'
         assert node[1].tag == 'ItemSentence'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
-    def __str__(self):
-        body = self.title[1:-1] + SPACE + self.sentence if self.title else self.sentence
-        if self.children:
-            body += '\n' + self.__str_children__()
-        return INDENT + body
+    def _str_head(self):
+        return INDENT + (self.title[1:-1] + SPACE + self.sentence if self.title else self.sentence)
 
 
 class Subitem1(BaseItemClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.SUBITEM1
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Subitem1'
         assert node[0].tag == 'Subitem1Title'
         assert node[1].tag == 'Subitem1Sentence'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
-    def __str__(self):
-        return INDENT * 2 + super().__str__()
+    def _str_head(self):
+        return INDENT * 2 + super()._str_head()
 
 
 class Subitem2(BaseItemClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.SUBITEM2
 
     def __init__(self, title=None, sentence=None, children=None):
         super().__init__(title, sentence, children)
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Subitem2'
         assert node[0].tag == 'Subitem2Title'
         assert node[1].tag == 'Subitem2Sentence'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
-    def __str__(self):
-        return INDENT * 3 + super().__str__()
+    def _str_head(self):
+        return INDENT * 3 + super()._str_head()
 
 
 class Subitem3(BaseItemClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.SUBITEM3
 
     def __init__(self, title=None, sentence=None, children=None):
         super().__init__(title, sentence, children)
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Subitem3'
         assert node[0].tag == 'Subitem3Title'
         assert node[1].tag == 'Subitem3Sentence'
-        return super().from_xml(node)
+        return super().from_xml(node, children)
 
-    def __str__(self):
-        return INDENT * 4 + super().__str__()
+    def _str_head(self):
+        return INDENT * 4 + super()._str_head()
 
 
 class Subitem4(BaseItemClass):
+    __slots__ = ()
     hierarchy = LawHierarchy.SUBITEM4
 
     def __init__(self, title=None, sentence=None, children=None):
         super().__init__(title, sentence, children)
 
     @classmethod
-    def from_xml(cls, node):
+    def from_xml(cls, node, children=None):
         assert node.tag == 'Subitem4'
         assert node[0].tag == 'Subitem4Title'
         assert node[1].tag == 'Subitem4Sentence'
-        return super().from_xml(node)
-
-    def __str__(self):
-        return INDENT * 5 + super().__str__()
+        return super().from_xml(node, children)
+
+    def _str_head(self):
+        return INDENT * 5 + super()._str_head()
+
+
+XML_TAG_TO_CLASS = {
+    'Part': Part,
+    'Chapter': Chapter,
+    'Section': Section,
+    'Subsection': Subsection,
+    'Division': Division,
+    'Article': Article,
+    'Paragraph': Paragraph,
+    'Item': Item,
+    'Subitem1': Subitem1,
+    'Subitem2': Subitem2,
+    'Subitem3': Subitem3,
+    'Subitem4': Subitem4
+}
+XML_TAG_TO_PLACEHOLDER = {
+    'TableStruct': '<表略>',
+    'List': '<一覧略>',
+    'FigStruct': '<図略>',
+    'AmendProvision': '<修正略>',
+    'SupplNote': '<注釈略>'
+}
 
 
 class LawTreeBuilder:
     """
     Build LawTree bottom-up
+
+    hrchy2nodes[rank]に追加済みのノードを保持し、ノードの存在する階層をactive_maskのビットで管理する
     """
 
     def __init__(self):
-        self.hrchy2nodes = dict()
-        for hrchy in LawHierarchy:
-            self.hrchy2nodes[hrchy] = list()
+        self.hrchy2nodes = [list() for _ in HIERARCHIES]
+        self.active_mask = 0
 
     def add(self, node):
         assert isinstance(node, BaseLawClass)
 
-        # special case to merge ArticleCaption
-        if isinstance(node, Article) and node.is_caption_only():
-            if not (self.hrchy2nodes[LawHierarchy.ARTICLE]):
-                raise ValueError("ArticleCaption can not be added without previous Article")
-            self.hrchy2nodes[LawHierarchy.ARTICLE][-1].caption = node.caption
-            return
-
-        while node.children:
-            self.add(node.children.pop())
+        # add children in reverse order before their parent
+        stack = [(node, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                self._collect(node)
+                continue
+
+            # special case to merge ArticleCaption
+            if isinstance(node, Article) and node.is_caption_only():
+                articles = self.hrchy2nodes[LawHierarchy.ARTICLE.rank]
+                if not articles:
+                    raise ValueError("ArticleCaption can not be added without previous Article")
+                articles[-1].caption = node.caption
+                continue
+
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+            node.children = []
+
+    def _collect(self, node):
         try:
             node.children = self._get_children(parent_hrchy=node.hierarchy, flush=True)
         except ValueError as e:
             msg = 'failed to add new node as there are active child nodes at multiple hierarchy'
             raise ValueError(msg) from e
-        self.hrchy2nodes[node.hierarchy].append(node)
+        self.hrchy2nodes[node.hierarchy.rank].append(node)
+        self.active_mask |= 1 << node.hierarchy.rank
 
     def build(self):
         try:
@@ -528,24 +1210,20 @@ class LawTreeBuilder:
             raise ValueError(msg) from e
 
     def _get_children(self, parent_hrchy, flush):
-        child_hrchy_list = parent_hrchy.children() if parent_hrchy is not None else LawHierarchy
-        active_child_hrchy_list = []
-        for hrchy in child_hrchy_list:
-            if self.hrchy2nodes[hrchy]:
-                active_child_hrchy_list.append(hrchy)
-
-        if len(active_child_hrchy_list) == 0:
+        mask = self.active_mask & (parent_hrchy.child_mask() if parent_hrchy is not None else ALL_HIERARCHY_MASK)
+        if mask == 0:
             return list()
-        elif len(active_child_hrchy_list) == 1:
-            hrchy = active_child_hrchy_list[0]
-            children = self.hrchy2nodes[hrchy][::-1]
+        elif mask & (mask - 1) == 0:  # only one bit is set
+            rank = mask.bit_length() - 1
+            children = self.hrchy2nodes[rank][::-1]
             if flush:
-                self.hrchy2nodes[hrchy] = list()
+                self.hrchy2nodes[rank] = list()
+                self.active_mask &= ~mask
             return children
         else:
             msg = 'found multiple active child hierarchy under {0} ({1})'.format(
                 parent_hrchy.value if parent_hrchy else 'root',
-                ','.join(map(lambda x: x.value, active_child_hrchy_list)))
+                ','.join(map(lambda x: x.value, filter(lambda x: mask >> x.rank & 1, HIERARCHIES))))
             raise ValueError(msg)
 
 
@@ -553,14 +1231,11 @@ def title_to_hierarchy(text):
     # special case for Paragraph
     if text.isdigit():
         return LawHierarchy.PARAGRAPH
+    hrchy, _ = classify_hierarchy(text)
     # special case for Item
-    m = re.fullmatch(r'[{0}]+(の[{0}]+)*'.format(NUMBER_KANJI), text)
-    if m:
+    if hrchy is None and PATTERN_ITEM_NUMBER.fullmatch(text):
         return LawHierarchy.ITEM
-    for hrchy in LawHierarchy:
-        if hrchy.extract(text, allow_placeholder=False, allow_partial_match=False):
-            return hrchy
-    return None
+    return hrchy
 
 
 def line_to_law_node(text):
@@ -597,37 +1272,247 @@ def line_to_law_node(text):
         return Subitem3(title=maybe_title, sentence=maybe_sentence)
 
     # special case for ArticleCaption
-    match = re.fullmatch(r'(（.+）)', text)
+    match = PATTERN_ARTICLE_CAPTION.fullmatch(text)
     if match:
         return Article(caption=match.group(1))
     return None
 
 
 class LawNodeFinder:
+    """
+    queryに一致するノードを検索する
+
+    各階層について、前の階層で見つかったノード以下を幅優先探索し、titleがqueryで始まる最初のノードを選ぶ
+    探索の起点ごとに、titleの接頭辞から最初に見つかるノードへの索引を初回の検索時に作成して再利用する
+    索引はtitleと木構造のみに依存するため、sentenceを変更しても有効である
+
+    未読み込みのArticle（Article.is_lazy）の子孫は、そのArticleを起点に検索する場合か、
+    条を指定せずに項以下の階層を検索する場合に初めて読み込む（条より上の階層のtitleは項以下のtitleと一致しない）
+
+    snapshotを呼ぶと、それ以降はcopy_on_writeで変更するノードから最上位までの経路だけを複製し、snapshotの木は変更しない
+    複製したノードは索引に反映せず、検索結果を置き換え前から置き換え後のノードへ辿り直して返す
+    """
+
     def __init__(self, nodes):
         self.nodes = nodes
+        self.parents = dict()  # id(node) -> parent node
+        self.root_index, self.is_partial = self._build_index(nodes, self.parents, expand_lazy=False)
+        self.node_indices = dict()  # id(node) -> index of the subtree
+        self.address_index = None  # see find_by_address
+        self.is_shared = False  # True if nodes are shared with a snapshot
+        self.owned = set()  # id of nodes copied after the last snapshot, which can be modified in place
+        self.replaced = dict()  # id(node) -> (node, copied node). keep the node to prevent reuse of id
 
-    def _find(self, nodes, query, hierarchy):
-        subquery = query.get(hierarchy)
-        if subquery == '':  # no need to process this hierarchy
-            if hierarchy == LawHierarchy.last():
-                return nodes
-            else:
-                return self._find(nodes, query, hierarchy.children()[0])
-
-        # BFS for node that matches subquery
+    @staticmethod
+    def _build_index(nodes, parents, expand_lazy=True):
+        """
+        索引と、未読み込みのArticleを展開せずに飛ばしたかどうかを返す
+        """
+        index = dict()
+        skipped = False
         q = deque(nodes)
         while q:
             node = q.popleft()
-            if node.title.startswith(subquery):  # use startswith as title can also includes caption
-                if hierarchy == LawHierarchy.last():
-                    return [node]
-                else:
-                    return self._find([node], query, hierarchy.children()[0])
+            title = node.title or ''
+            # use prefixes as title can also includes caption
+            for end in range(len(title), 0, -1):
+                prefix = title[:end]
+                if prefix in index:  # shorter prefixes are already registered by the same or former node
+                    break
+                index[prefix] = node
+            if not expand_lazy and node.is_lazy():
+                skipped = True
+                continue
+            for child in node.children:
+                parents[id(child)] = node
             q.extend(node.children)
-        return list()
+        return index, skipped
+
+    def mark_dirty(self, node):
+        """
+        変更したnodeとその祖先のキャッシュを破棄する
+        """
+        while node is not None:
+            node.clear_cache()
+            node = self.parents.get(id(node))
+
+    def snapshot(self):
+        """
+        現在の木の最上位のノードのlistを返す。以降のcopy_on_writeによる変更は返した木に影響しない
+        """
+        self.is_shared = True
+        self.owned = set()
+        return self.nodes
+
+    def copy_on_write(self, node):
+        """
+        nodeを変更する前に呼び、変更してよいノードを返す
+
+        snapshotの木と共有しているノードであれば、nodeから最上位までの祖先を複製して現在の木を置き換え、nodeの複製を返す
+        snapshotを呼んでいなければnodeをそのまま返す
+        """
+        if not self.is_shared:
+            return node
+        node = self._resolve(node)
+        if id(node) in self.owned:
+            return node
+        target = None
+        child = copied_child = None
+        while node is not None and id(node) not in self.owned:
+            parent = self.parents.get(id(node))
+            copied = node.copy()
+            if copied_child is not None:
+                _replace_child(copied.children, child, copied_child)
+            for grandchild in copied.children:
+                self.parents[id(grandchild)] = copied
+            if parent is not None:
+                self.parents[id(copied)] = parent
+            if id(node) in self.node_indices:
+                self.node_indices[id(copied)] = self.node_indices[id(node)]
+            self.owned.add(id(copied))
+            self.replaced[id(node)] = (node, copied)
+            target = copied if target is None else target
+            child, copied_child = node, copied
+            node = parent
+
+        if node is not None:  # reached a node already copied after the snapshot
+            _replace_child(node.children, child, copied_child)
+        else:  # replace root node
+            if id(self.nodes) not in self.owned:
+                self.nodes = list(self.nodes)
+                self.owned.add(id(self.nodes))
+            _replace_child(self.nodes, child, copied_child)
+        return target
+
+    def _resolve(self, node):
+        """
+        copy_on_writeで置き換えられたノードであれば、置き換え後のノードを返す
+        """
+        while node is not None and id(node) in self.replaced and self.replaced[id(node)][0] is node:
+            node = self.replaced[id(node)][1]
+        return node
+
+    def _get_index(self, node):
+        key = id(node)
+        if key not in self.node_indices:
+            self.node_indices[key], _ = self._build_index([node], self.parents)
+        return self.node_indices[key]
+
+    def _get_root_index(self, hierarchy):
+        if self.is_partial and hierarchy.rank > LawHierarchy.ARTICLE.rank:
+            self.root_index, self.is_partial = self._build_index(self.nodes, self.parents)
+        return self.root_index
+
+    def find_by_address(self, address):
+        """
+        build_address_indexのアドレスに一致するノードを返す（存在しなければNone）
+
+        索引は初回の呼び出し時に全てのノードを辿って作成する
+        """
+        if self.address_index is None:
+            self.address_index = build_address_index(self.nodes)
+        return self._resolve(self.address_index.get(address))
 
     def find(self, query):
         if query.has(LawHierarchy.SUPPLEMENT) or query.has(LawHierarchy.CONTENTS) or query.has(LawHierarchy.TABLE):
             raise NotImplementedError
-        return self._find(self.nodes, query, LawHierarchy.first())
+        found = None
+        for hierarchy in HIERARCHIES:
+            subquery = query.get(hierarchy)
+            if subquery == '':  # no need to process this hierarchy
+                continue
+            index = self._get_root_index(hierarchy) if found is None else self._get_index(found)
+            found = self._resolve(index.get(subquery))
+            if found is None:
+                return list()
+        return [found] if found is not None else self.nodes
+
+
+def _replace_child(children, old, new):
+    # compare by identity, as __eq__ of BaseLawClass only compares titles
+    for i, child in enumerate(children):
+        if child is old:
+            children[i] = new
+            return
+    raise ValueError(f'failed to find {old} in children')
+
+
+class LawNodeChangeType(Enum):
+    CHANGED = 'changed'
+    INSERTED = 'inserted'
+    DELETED = 'deleted'
+
+
+class LawNodeChange:
+    """
+    diff_law_treeが返す、ひとつのノードの変更
+
+    CHANGEDはノード自身の内容（title以外のcaption, sentenceなど）の変更を表し、子ノードの変更は別のLawNodeChangeとなる
+    INSERTED, DELETEDは部分木全体の追加、削除を表す
+    """
+
+    __slots__ = ('type', 'path', 'before', 'after')
+
+    def __init__(self, type, path, before, after):
+        self.type = type
+        self.path = path  # tuple of titles from the root to the node
+        self.before = before  # None if inserted
+        self.after = after  # None if deleted
+
+    def article_path(self):
+        """
+        pathのうち条までの部分を返す（条より上の階層のノードであればpathをそのまま返す）
+        """
+        node = self.after if self.after is not None else self.before
+        if node.hierarchy is not None and node.hierarchy.rank <= LawHierarchy.ARTICLE.rank:
+            return self.path
+        for i in range(len(self.path) - 1, -1, -1):
+            if title_to_hierarchy(self.path[i]) == LawHierarchy.ARTICLE:
+                return self.path[:i + 1]
+        return self.path
+
+    def to_dict(self):
+        return {
+            'type': self.type.value,
+            'path': '/'.join(self.path),
+            'before': self.before._str_head() if self.before is not None else None,
+            'after': self.after._str_head() if self.after is not None else None
+        }
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.type.value} {"/".join(self.path)}>'
+
+
+def diff_law_tree(before_nodes, after_nodes):
+    """
+    2つの法令の木を比較し、変更、追加、削除されたノードのLawNodeChangeを文書順に返す（削除されたノードは同じ親の子ノードの後に並べる）
+
+    同じ親の子ノードはkey（build_address_indexを参照）で対応付ける
+    同一の部分木（LawNodeFinder.copy_on_writeで共有される部分木）やdigestが一致する部分木は辿らないため、
+    変更箇所が少なければ比較は変更箇所の周辺だけで済む
+    """
+    changes = []
+    stack = [(before_nodes, after_nodes, ())]  # list of LawNodeChange or (before children, after children, path)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, LawNodeChange):
+            changes.append(item)
+            continue
+        before_children, after_children, path = item
+        before_map = dict(_iter_unique_keys(before_children))
+        level = []
+        for key, node in _iter_unique_keys(after_children):
+            before = before_map.pop(key, None)
+            node_path = path + (node.title,)
+            if before is None:
+                level.append(LawNodeChange(LawNodeChangeType.INSERTED, node_path, None, node))
+            elif before is not node and before.digest() != node.digest():
+                if before._digest_fields() != node._digest_fields():
+                    level.append(LawNodeChange(LawNodeChangeType.CHANGED, node_path, before, node))
+                level.append((before.children, node.children, node_path))
+        for node in before_map.values():
+            level.append(LawNodeChange(LawNodeChangeType.DELETED, path + (node.title,), node, None))
+        stack.extend(reversed(level))
+    return changes
+
+
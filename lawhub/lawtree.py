@@ -0,0 +1,395 @@
+"""
+法令の木構造を配列で表現するクラスを定義する
+
+BaseLawClassの木はノードごとにPythonオブジェクトを持つため、法令全体をまとめて扱う場合にはメモリを大きく消費する
+FlatLawTreeはノードの親子関係を整数の配列で、文字列をひとつのバッファへのオフセットで保持する
+LawCorpusは複数の法令のFlatLawTreeをひとつのファイルにまとめ、mmapで複数のプロセスから共有する
+"""
+
+import json
+import mmap
+import os
+import struct
+from array import array
+from collections import deque
+from logging import getLogger
+from pathlib import Path
+
+from lawhub.law import LawHierarchy, BaseLawClass, Part, Chapter, Section, Subsection, Division, Article, Paragraph, \
+    BaseItemClass, Item, Subitem1, Subitem2, Subitem3, Subitem4, LawDocument, SPACE, INDENT
+
+LOGGER = getLogger(__name__)
+NODE_CLASSES = [BaseLawClass, Part, Chapter, Section, Subsection, Division, Article, Paragraph, Item, Subitem1, Subitem2, Subitem3, Subitem4]
+NODE_CLASS_TO_CODE = {cls: code for code, cls in enumerate(NODE_CLASSES)}
+FIELDS = ('title', 'caption', 'number', 'sentence')
+TITLE, CAPTION, NUMBER, SENTENCE = range(len(FIELDS))
+SUBITEM_INDENT = {Subitem1: INDENT * 2, Subitem2: INDENT * 3, Subitem3: INDENT * 4, Subitem4: INDENT * 5}
+NONE = -1
+MAGIC = b'LWT2'
+HEADER = struct.Struct('<4sIII')  # magic, number of nodes, length of encoded text, reserved
+CORPUS_MAGIC = b'LWC1'
+CORPUS_HEADER = struct.Struct('<4sIQ')  # magic, number of laws, offset of JSON encoded index
+
+
+class FlatLawTree:
+    """
+    法令の木構造を並列な配列で保持する
+
+    * parent, first_child, next_sibling: ノードの番号（存在しない場合は-1）
+    * code: ノードのクラスを表す番号（NODE_CLASSESのindex）
+    * offsets: ノードi, フィールドfの文字列はUTF-8のtext[offsets[i * 4 + f]:offsets[i * 4 + f + 1]]
+
+    ノードは行きがけ順に番号付けされ、最上位のノードは0番から順にnext_siblingで辿れる
+    to_bytes/from_bytesで、各配列を並べただけのバイナリ形式と相互に変換できる
+    from_bytesは配列をコピーせずdataのmemoryviewとして参照するため、mmapしたファイルや共有メモリから直接読み込める
+    """
+
+    def __init__(self, parent, code, first_child, next_sibling, offsets, text):
+        self.parent = parent
+        self.code = code
+        self.first_child = first_child
+        self.next_sibling = next_sibling
+        self.offsets = offsets
+        self.text = text
+
+    def __len__(self):
+        return len(self.code)
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """
+        BaseLawClassの木から変換する
+        """
+        parent = array('i')
+        code = array('b')
+        first_child = array('i')
+        next_sibling = array('i')
+        offsets = array('q', [0])
+        chunks = []
+        length = 0
+
+        stack = [(node, NONE) for node in reversed(nodes)]
+        last_child = {}  # parent index -> last child index
+        while stack:
+            node, parent_idx = stack.pop()
+            idx = len(code)
+            if type(node) not in NODE_CLASS_TO_CODE:
+                raise ValueError(f'unsupported node type: {type(node)}')
+            parent.append(parent_idx)
+            code.append(NODE_CLASS_TO_CODE[type(node)])
+            first_child.append(NONE)
+            next_sibling.append(NONE)
+            prev_idx = last_child.get(parent_idx, NONE)
+            if prev_idx != NONE:
+                next_sibling[prev_idx] = idx
+            elif parent_idx != NONE:
+                first_child[parent_idx] = idx
+            last_child[parent_idx] = idx
+
+            for field in FIELDS:
+                value = getattr(node, field, None)
+                value = str(value).encode('utf-8') if value is not None else b''
+                chunks.append(value)
+                length += len(value)
+                offsets.append(length)
+            stack.extend((child, idx) for child in reversed(node.children))
+        return cls(parent, code, first_child, next_sibling, offsets, b''.join(chunks))
+
+    @classmethod
+    def from_xml_fp(cls, xml_fp, backend=None):
+        """
+        Lawのxmlファイルの本文から変換する（BaseLawClassの木は変換後に破棄される）
+        """
+        return cls.from_nodes(LawDocument.from_xml_fp(xml_fp, backend).nodes)
+
+    def to_bytes(self):
+        """
+        HEADER, offsets(int64), parent, first_child, next_sibling(int32), code(int8), text(UTF-8)の順に並べたバイナリを返す
+        """
+        return b''.join([
+            HEADER.pack(MAGIC, len(self), len(self.text), 0),
+            self.offsets.tobytes(),
+            self.parent.tobytes(),
+            self.first_child.tobytes(),
+            self.next_sibling.tobytes(),
+            self.code.tobytes(),
+            self.text
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        to_bytesのバイナリから変換する。配列とtextはdataを参照するので、変換後のFlatLawTreeを使う間はdataを閉じてはならない
+        """
+        view = memoryview(data).cast('B')
+        magic, size, text_size, _ = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'invalid magic number: {magic}')
+        arrays = []
+        pos = HEADER.size
+        for typecode, length in [('q', size * len(FIELDS) + 1), ('i', size), ('i', size), ('i', size), ('b', size)]:
+            end = pos + array(typecode).itemsize * length
+            arrays.append(view[pos:end].cast(typecode))
+            pos = end
+        if len(view) != pos + text_size:
+            raise ValueError(f'invalid data size: expected {pos + text_size} but got {len(view)}')
+        offsets, parent, first_child, next_sibling, code = arrays
+        return cls(parent, code, first_child, next_sibling, offsets, view[pos:])
+
+    def get(self, idx, field):
+        k = idx * len(FIELDS) + field
+        return str(self.text[self.offsets[k]:self.offsets[k + 1]], 'utf-8')
+
+    def title(self, idx):
+        return self.get(idx, TITLE)
+
+    def node_class(self, idx):
+        return NODE_CLASSES[self.code[idx]]
+
+    def hierarchy(self, idx):
+        return self.node_class(idx).hierarchy
+
+    def roots(self):
+        idx = 0 if len(self) > 0 else NONE
+        while idx != NONE:
+            yield idx
+            idx = self.next_sibling[idx]
+
+    def children(self, idx):
+        idx = self.first_child[idx]
+        while idx != NONE:
+            yield idx
+            idx = self.next_sibling[idx]
+
+    def to_node(self, idx):
+        """
+        idx番目のノード以下をBaseLawClassの木に変換する
+        """
+        built = {}
+        stack = [(idx, False)]
+        while stack:
+            i, visited = stack.pop()
+            if visited:
+                children = [built.pop(child) for child in self.children(i)]
+                built[i] = self._instantiate(i, children)
+            else:
+                stack.append((i, True))
+                stack.extend((child, False) for child in self.children(i))
+        return built[idx]
+
+    def to_nodes(self):
+        """
+        BaseLawClassの木に変換する
+        """
+        return [self.to_node(idx) for idx in self.roots()]
+
+    def _instantiate(self, idx, children):
+        cls = self.node_class(idx)
+        title = self.get(idx, TITLE)
+        if cls is Article:
+            return cls(title=title, caption=self.get(idx, CAPTION), number=self.get(idx, NUMBER), children=children)
+        elif cls is Paragraph:
+            return cls(title=title, number=int(self.get(idx, NUMBER)), sentence=self.get(idx, SENTENCE), children=children)
+        elif issubclass(cls, BaseItemClass):
+            return cls(title=title, sentence=self.get(idx, SENTENCE), children=children)
+        else:
+            return cls(title=title, children=children)
+
+    def _render_head(self, idx):
+        cls = self.node_class(idx)
+        title = self.get(idx, TITLE)
+        if cls is Article:
+            caption = self.get(idx, CAPTION)
+            return caption + '\n' + title if caption else title
+        elif cls is Paragraph:
+            number = self.get(idx, NUMBER)
+            sentence = self.get(idx, SENTENCE)
+            return sentence if number == '1' else number + SPACE + sentence
+        elif cls is Item:
+            sentence = self.get(idx, SENTENCE)
+            return INDENT + (title[1:-1] + SPACE + sentence if title else sentence)
+        elif cls in SUBITEM_INDENT:
+            return SUBITEM_INDENT[cls] + title + SPACE + self.get(idx, SENTENCE)
+        else:
+            return title
+
+    def iter_render(self, idx):
+        """
+        idx番目のノード以下をstr(BaseLawClass)と同じ形式で出力する文字列を順に返す（lawhub.law.iter_law_tree_textを参照）
+        """
+        stack = [idx]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                yield item
+                continue
+            cls = self.node_class(item)
+            yield self._render_head(item)
+            if cls._str_tail:
+                stack.append(cls._str_tail)
+            children = list(self.children(item))
+            for k in range(len(children) - 1, -1, -1):
+                stack.append(children[k])
+                stack.append('\n' if k > 0 else cls._str_separator)
+
+    def render(self, idx):
+        return ''.join(self.iter_render(idx))
+
+    def save(self, law_title, fp):
+        """
+        save_law_treeと同じ形式で保存する
+        """
+        with open(fp, 'w') as f:
+            f.write(f'{law_title}\n\n')
+            for idx in self.roots():
+                f.writelines(self.iter_render(idx))
+                f.write('\n')
+
+    def find(self, query):
+        """
+        LawNodeFinder.findと同様に、queryに一致するノードの番号を返す
+        """
+        if query.has(LawHierarchy.SUPPLEMENT) or query.has(LawHierarchy.CONTENTS) or query.has(LawHierarchy.TABLE):
+            raise NotImplementedError
+        candidates = list(self.roots())
+        for hierarchy in LawHierarchy:
+            subquery = query.get(hierarchy)
+            if subquery == '':  # no need to process this hierarchy
+                continue
+            subquery = subquery.encode('utf-8')
+            found = NONE
+            q = deque(candidates)
+            while q:
+                idx = q.popleft()
+                k = idx * len(FIELDS) + TITLE
+                start = self.offsets[k]
+                if start + len(subquery) <= self.offsets[k + 1] and \
+                        self.text[start:start + len(subquery)] == subquery:  # same as title.startswith(subquery)
+                    found = idx
+                    break
+                q.extend(self.children(idx))
+            if found == NONE:
+                return list()
+            candidates = [found]
+        return candidates
+
+
+class LawCorpusWriter:
+    """
+    複数の法令のFlatLawTreeをひとつのファイルに書き出す（LawCorpusで読み込む）
+
+    CORPUS_HEADER, 各法令のFlatLawTree.to_bytes()（8バイト境界に整列）, 索引（JSON）の順に並べる
+    一時ファイルに書き込んでcloseでrenameするため、読み込み中のプロセスが不完全なファイルを開くことはない
+    """
+
+    def __init__(self, fp):
+        self.fp = Path(fp)
+        self.tmp_fp = self.fp.with_name(self.fp.name + '.tmp')
+        self.f = open(self.tmp_fp, 'wb')
+        self.f.write(CORPUS_HEADER.pack(CORPUS_MAGIC, 0, 0))
+        self.index = []
+        self.keys = set()
+
+    def add(self, key, meta, tree):
+        """
+        :param key: 法令を識別する文字列（例: XMLファイルの相対パス）
+        :param meta: LawDocument.meta
+        :param tree: FlatLawTree
+        """
+        if key in self.keys:
+            raise ValueError(f'duplicated key: {key}')
+        pos = self.f.tell()
+        padding = -pos % 8
+        self.f.write(b'\0' * padding)
+        data = tree.to_bytes()
+        self.f.write(data)
+        self.index.append({'key': key, 'meta': meta, 'offset': pos + padding, 'size': len(data)})
+        self.keys.add(key)
+
+    def close(self):
+        index_offset = self.f.tell()
+        self.f.write(json.dumps(self.index, ensure_ascii=False).encode('utf-8'))
+        self.f.seek(0)
+        self.f.write(CORPUS_HEADER.pack(CORPUS_MAGIC, len(self.index), index_offset))
+        self.f.close()
+        os.replace(self.tmp_fp, self.fp)
+        LOGGER.debug(f'saved {len(self.index)} laws to {self.fp}')
+
+    def abort(self):
+        self.f.close()
+        self.tmp_fp.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class LawCorpus:
+    """
+    LawCorpusWriterで書き出したファイルを読み込み専用で参照する
+
+    openはファイルをmmapするため、複数のプロセスが同じファイルを開いてもページキャッシュを共有し、
+    法令ごとのパースやunpickleなしにget_treeでFlatLawTreeを取り出せる
+    ファイルの内容をコピーしたmultiprocessing.shared_memory.SharedMemoryのbufなど、任意のバッファからも作成できる
+    """
+
+    def __init__(self, buffer, mm=None):
+        self.buffer = memoryview(buffer).cast('B')
+        self.mm = mm
+        magic, count, index_offset = CORPUS_HEADER.unpack_from(self.buffer)
+        if magic != CORPUS_MAGIC:
+            raise ValueError(f'invalid magic number: {magic}')
+        index = json.loads(str(self.buffer[index_offset:], 'utf-8'))
+        if len(index) != count:
+            raise ValueError(f'invalid index size: expected {count} but got {len(index)}')
+        self.index = {entry['key']: entry for entry in index}
+
+    @classmethod
+    def open(cls, fp):
+        with open(fp, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, mm)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def get_meta(self, key):
+        return self.index[key]['meta']
+
+    def get_tree(self, key):
+        """
+        keyの法令のFlatLawTreeを返す（バッファをコピーせずに参照する）
+        """
+        entry = self.index[key]
+        return FlatLawTree.from_bytes(self.buffer[entry['offset']:entry['offset'] + entry['size']])
+
+    def get_document(self, key):
+        """
+        keyの法令をLawDocumentに変換して返す
+        """
+        return LawDocument(meta=self.get_meta(key), nodes=self.get_tree(key).to_nodes())
+
+    def close(self):
+        """
+        バッファを解放する。get_treeで取り出したFlatLawTreeが残っている場合はBufferErrorとなる
+        """
+        self.buffer.release()
+        if self.mm is not None:
+            self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,101 @@
+"""
+漢数字と整数を相互に変換する
+
+1から9999までは読み込み時に作成した表を引き、一億未満は表と'万'の組み合わせで変換する
+それ以外の入力はkanjizeに委ねるため、結果はkanjizeのint2kanji, kanji2intと一致する
+"""
+
+import re
+from functools import lru_cache
+
+import kanjize
+
+from lawhub.constants import NUMBER_KANJI, IROHA
+
+DIGITS = ['', '一', '二', '三', '四', '五', '六', '七', '八', '九']
+TABLE_SIZE = 10000
+ROMAN_VALUES = {'i': 1, 'v': 5, 'x': 10, 'ｉ': 1, 'ｖ': 5, 'ｘ': 10}
+
+
+def _build_table():
+    table = []
+    for number in range(TABLE_SIZE):
+        chunks = []
+        for unit, base in [('千', 1000), ('百', 100), ('十', 10)]:
+            digit = number // base % 10
+            if digit:
+                chunks.append((DIGITS[digit] if digit > 1 else '') + unit)
+        chunks.append(DIGITS[number % 10])
+        table.append(''.join(chunks))
+    return table
+
+
+KANJI_TABLE = _build_table()
+KANJI_TO_INT = {kanji: number for number, kanji in enumerate(KANJI_TABLE) if number > 0}
+PATTERN_SORT_KEY = re.compile(r'[第\(（]?([{0}]+|[0-9０-９]+|[{1}]+|[{2}])[編章節款目条項号\)）]?((?:の[{0}]+)*)'.format(
+    NUMBER_KANJI, ''.join(ROMAN_VALUES), IROHA))
+PATTERN_NON_DIGIT = re.compile(r'[^0-9]+')
+
+
+def int2kanji(number):
+    """
+    12 -> '十二'
+    """
+    if 0 <= number < TABLE_SIZE:
+        return KANJI_TABLE[number]
+    elif TABLE_SIZE <= number < TABLE_SIZE ** 2:
+        return KANJI_TABLE[number // TABLE_SIZE] + '万' + KANJI_TABLE[number % TABLE_SIZE]
+    return kanjize.int2kanji(number)
+
+
+def kanji2int(kanji):
+    """
+    '十二' -> 12
+    """
+    if kanji in KANJI_TO_INT:
+        return KANJI_TO_INT[kanji]
+    high, sep, low = kanji.partition('万')
+    if sep and high in KANJI_TO_INT and (low == '' or low in KANJI_TO_INT):
+        return KANJI_TO_INT[high] * TABLE_SIZE + (KANJI_TO_INT[low] if low else 0)
+    return kanjize.kanji2int(kanji)
+
+
+def roman2int(roman):
+    """
+    'xiv' -> 14
+    """
+    number = 0
+    for i, c in enumerate(roman):
+        value = ROMAN_VALUES[c]
+        number += -value if i + 1 < len(roman) and value < ROMAN_VALUES[roman[i + 1]] else value
+    return number
+
+
+@lru_cache(maxsize=2 ** 16)
+def title_to_sort_key(title):
+    """
+    '第十二条の二' -> (12, 2), '（ｉｉ）' -> (2,), 'ロ' -> (2,)。番号を読み取れなければ()を返す
+    """
+    m = PATTERN_SORT_KEY.match(title) if title else None
+    if not m:
+        return ()
+    number = m.group(1)
+    if number[0] in NUMBER_KANJI:
+        key = [kanji2int(number)]
+    elif number[0] in ROMAN_VALUES:
+        key = [roman2int(number)]
+    elif number[0] in IROHA:
+        key = [IROHA.index(number) + 1]
+    else:
+        key = [int(number)]
+    if m.group(2):
+        key.extend(map(kanji2int, m.group(2)[1:].split('の')))
+    return tuple(key)
+
+
+@lru_cache(maxsize=2 ** 16)
+def number_to_sort_key(number):
+    """
+    e-govのNum属性から変換する: '12_2' -> (12, 2), '226:227' -> (226, 227)
+    """
+    return tuple(map(int, filter(None, PATTERN_NON_DIGIT.split(number))))
@@ -2,7 +2,7 @@ import copy
 from enum import Enum
 from logging import getLogger
 
-from lawhub.law import LawHierarchy
+from lawhub.law import LawHierarchy, extract_hierarchies
 from lawhub.serializable import Serializable
 
 LOGGER = getLogger(__name__)
@@ -29,10 +29,8 @@ class Query(Serializable):
             self._init_hierarchy_map()
 
     def _init_hierarchy_map(self):
-        for hrchy in LawHierarchy:
-            maybe_hrchy_text = hrchy.extract(self.text)
-            if maybe_hrchy_text:
-                self.set(hrchy, hrchy.extract(self.text))
+        for hrchy, hrchy_text in extract_hierarchies(self.text).items():
+            self.set(hrchy, hrchy_text)
 
     @classmethod
     def from_text(cls, text):
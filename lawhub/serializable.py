@@ -10,8 +10,10 @@ LOGGER = getLogger(__name__)
 
 
 class ToDictMixin(object):
+    __slots__ = ()
+
     def to_dict(self):
-        return self._traverse_dict(self.__dict__)
+        return self._traverse_dict(get_attributes(self))
 
     def _traverse_dict(self, instance_dict):
         output = {}
@@ -28,8 +30,8 @@ class ToDictMixin(object):
             return [self._traverse(key, i) for i in value]
         elif isinstance(value, Enum):
             return value.value
-        elif hasattr(value, '__dict__'):
-            return self._traverse_dict(value.__dict__)
+        elif hasattr(value, '__dict__') or hasattr(value, '__slots__'):
+            return self._traverse_dict(get_attributes(value))
         else:
             return value
 
@@ -48,10 +50,12 @@ class Serializable(ToDictMixin, metaclass=Registry):
     All attributes need to have corresponding arguments in constructor with the same name
     """
 
+    __slots__ = ()
+
     def to_dict(self):
         return self._traverse_dict({
             '__class__': self.__class__.__name__,
-            '__dict__': self.__dict__
+            '__dict__': get_attributes(self)
         })
 
     def serialize(self):
@@ -80,5 +84,21 @@ class Serializable(ToDictMixin, metaclass=Registry):
         return cls.from_dict(json.loads(data))
 
 
+def get_attributes(obj):
+    """
+    インスタンスの属性を辞書で返す
+    __slots__を用いるクラスでは基底クラスから順に属性を集める。ただし'_'で始まる属性（キャッシュなど）は含めない
+    """
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__
+    attributes = {}
+    for cls in reversed(type(obj).__mro__):
+        slots = cls.__dict__.get('__slots__', ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if not name.startswith('_') and hasattr(obj, name):
+                attributes[name] = getattr(obj, name)
+    return attributes
+
+
 def is_serializable(obj):
     return obj == Serializable.deserialize(obj.serialize())
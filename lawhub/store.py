@@ -0,0 +1,87 @@
+"""
+lawhub-xmlの法令をLawNumまたはLawTitleで検索し、パースした結果をメモリに保持する
+
+長時間動くプロセスで同じ法令を何度も参照する場合に、XMLファイルの検索とパースを繰り返さないために用いる
+"""
+
+from collections import OrderedDict
+from logging import getLogger
+
+from lawhub.constants import LAWHUB_STORE_SIZE
+from lawhub.fileutil import LawFinder
+from lawhub.law import LawDocument, LawNodeFinder
+
+LOGGER = getLogger(__name__)
+
+
+class LawStore:
+    """
+    lawhub-xmlのindex.tsvから法令のXMLファイルを探し（lawhub.fileutil.LawFinderを参照）、パースしたLawDocumentをLawNumをキーとするLRUで保持する
+
+    保持するLawDocumentの大きさはXMLファイルのサイズで数え、合計がmax_sizeを超えると最終利用の古いものから破棄する
+    getが返すLawDocumentは他の呼び出し元と共有するため変更してはならない。変更する場合はget_finderを使う
+    """
+
+    def __init__(self, directory=None, max_size=LAWHUB_STORE_SIZE, cache=None, backend=None):
+        """
+        :param directory: lawhub-xmlのディレクトリ。指定しなければLAWHUB_ROOT/lawhub-xml
+        :param cache: パースに用いるLawTreeCache
+        """
+        self.finder = LawFinder(directory)
+        self.max_size = max_size
+        self.cache = cache
+        self.backend = backend
+        self.documents = OrderedDict()  # LawNum -> (LawDocument, size), the last one is the most recently used
+        self.total_size = 0
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, law_num):
+        return law_num in self.documents
+
+    def get(self, law_num=None, law_title=None):
+        """
+        LawNumまたはLawTitleに一致する法令のLawDocumentを返す。保持していなければパースする
+        """
+        record = self.finder.find_record(law_num, law_title)
+        key = record['LawNum']
+        if key in self.documents:
+            self.documents.move_to_end(key)
+            self.hit_count += 1
+            return self.documents[key][0]
+
+        self.miss_count += 1
+        xml_fp = self.finder.directory / record['fp']
+        document = LawDocument.from_xml_fp(xml_fp, self.backend, cache=self.cache)
+        size = xml_fp.stat().st_size
+        self.documents[key] = (document, size)
+        self.total_size += size
+        LOGGER.debug(f'loaded {xml_fp} into store')
+        self._evict()
+        return document
+
+    def get_finder(self, law_num=None, law_title=None):
+        """
+        LawNumまたはLawTitleに一致する法令のLawNodeFinderを返す
+
+        LawNodeFinder.snapshotを呼んであるため、copy_on_writeで変更したノードは複製され、保持しているLawDocumentは変更されない
+        """
+        finder = LawNodeFinder(self.get(law_num, law_title).nodes)
+        finder.snapshot()
+        return finder
+
+    def clear(self):
+        self.documents.clear()
+        self.total_size = 0
+
+    def _evict(self):
+        """
+        合計サイズがmax_size以下になるまで最終利用の古いものから破棄する（最後に読み込んだものは残す）
+        """
+        while self.total_size > self.max_size and len(self.documents) > 1:
+            key, (_, size) = self.documents.popitem(last=False)
+            self.total_size -= size
+            LOGGER.debug(f'evicted {key} from store')
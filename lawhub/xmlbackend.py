@@ -0,0 +1,116 @@
+"""
+XMLパーサーのバックエンドを定義する
+
+lxmlがインストールされていればlxmlを、そうでなければxml.etree.ElementTreeを用いる
+環境変数LAWHUB_XML_BACKEND（'lxml'または'etree'）で明示的に指定することもできる
+"""
+
+import os
+import xml.etree.ElementTree as ET
+from logging import getLogger
+
+from lawhub.constants import LAWHUB_XML_BACKEND
+
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+LOGGER = getLogger(__name__)
+
+
+class XmlBackend:
+    name = None
+
+    def iterparse(self, source, events=('end',)):
+        """
+        (event, element)を順に返す
+        """
+        raise NotImplementedError
+
+    def parse(self, source):
+        """
+        XMLファイルを読み込み、root elementを返す
+        """
+        raise NotImplementedError
+
+    def fromstring(self, data):
+        """
+        XMLのbytesを読み込み、root elementを返す
+        """
+        raise NotImplementedError
+
+    def write(self, elem, fp):
+        """
+        elementをroot elementとしてUTF-8で保存する
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}>'
+
+
+class ElementTreeBackend(XmlBackend):
+    name = 'etree'
+
+    def iterparse(self, source, events=('end',)):
+        return ET.iterparse(source, events=events)
+
+    def parse(self, source):
+        return ET.parse(source).getroot()
+
+    def fromstring(self, data):
+        return ET.fromstring(data)
+
+    def write(self, elem, fp):
+        ET.ElementTree(elem).write(fp, encoding='UTF-8')
+
+
+class LxmlBackend(XmlBackend):
+    """
+    lxmlはコメントや処理命令も要素として扱うため、ElementTreeと同じ木になるように読み込み時に除去する
+    """
+
+    name = 'lxml'
+
+    def __init__(self):
+        if LET is None:
+            raise ImportError('lxml is not installed')
+        self.parser = LET.XMLParser(remove_comments=True, remove_pis=True, resolve_entities=False, huge_tree=True)
+
+    def iterparse(self, source, events=('end',)):
+        return LET.iterparse(self._fspath(source), events=events, remove_comments=True, remove_pis=True, resolve_entities=False, huge_tree=True)
+
+    def parse(self, source):
+        return LET.parse(self._fspath(source), self.parser).getroot()
+
+    def fromstring(self, data):
+        return LET.fromstring(data, self.parser)
+
+    def write(self, elem, fp):
+        LET.ElementTree(elem).write(self._fspath(fp), encoding='UTF-8')
+
+    @staticmethod
+    def _fspath(source):
+        return os.fspath(source) if isinstance(source, os.PathLike) else source
+
+
+def available_backends():
+    return [ElementTreeBackend.name] + ([LxmlBackend.name] if LET is not None else [])
+
+
+def get_backend(name=None):
+    """
+    nameに対応するXmlBackendを返す。指定しない場合はlxmlがあればlxmlを用いる
+    """
+    name = name if name else LAWHUB_XML_BACKEND
+    if not name:
+        name = LxmlBackend.name if LET is not None else ElementTreeBackend.name
+    if name == ElementTreeBackend.name:
+        return ElementTreeBackend()
+    elif name == LxmlBackend.name:
+        return LxmlBackend()
+    raise ValueError(f'unknown xml backend: "{name}"')
+
+
+BACKEND = get_backend()
@@ -0,0 +1,263 @@
+"""
+法令XMLの要素のバイト位置の索引を定義する
+
+MainProvisionと編・章・節・款・目の子要素（見出しを除く）について、XMLファイル内のバイト範囲と見出しを記録する
+索引を用いると、法令全体をパースせずに特定の条だけを読み込める（lawhub.law.parse_article_xml_fpを参照）
+また、編・章・節・款・目と条の見出しだけから法令の骨組みを構築できる（LawDocument.from_xml_fpのlazyを参照）
+索引はlawhub-xmlのリポジトリにコミットされないよう、LAWHUB_DATA以下に保存する
+"""
+
+import hashlib
+import os
+import re
+import xml.parsers.expat
+from logging import getLogger
+from pathlib import Path
+
+from lawhub.constants import LAWHUB_DATA, LAWHUB_ROOT
+
+LOGGER = getLogger(__name__)
+SECTION_TAGS = ('Part', 'Chapter', 'Section', 'Subsection', 'Division')
+INDEX_SUFFIX = '.idx'
+INDEX_DIRECTORY = LAWHUB_DATA / 'xmlindex'
+LAWHUB_XML_DIRECTORY = LAWHUB_ROOT / 'lawhub-xml'
+MAGIC = 'LawXmlIndex'
+VERSION = '4'
+ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n'}
+UNESCAPES = {val: key for key, val in ESCAPES.items()}
+
+
+class XmlIndexEntry:
+    __slots__ = ('tag', 'num', 'parent', 'start', 'end', 'title', 'caption')
+
+    def __init__(self, tag, num, parent, start, end, title='', caption=''):
+        self.tag = tag
+        self.num = num
+        self.parent = parent  # index of parent entry, -1 if the parent is MainProvision
+        self.start = start  # byte offset of '<'
+        self.end = end  # byte offset next to '>' of the end tag
+        self.title = title  # text of the title element, e.g. ChapterTitle and ArticleTitle
+        self.caption = caption  # text of ArticleCaption
+
+    def __repr__(self):
+        return f'<XmlIndexEntry {self.tag} Num={self.num} [{self.start}:{self.end}]>'
+
+    def __eq__(self, other):
+        return isinstance(other, XmlIndexEntry) and \
+               self._fields() == other._fields()
+
+    def _fields(self):
+        return self.tag, self.num, self.parent, self.start, self.end, self.title, self.caption
+
+
+class LawXmlIndex:
+    """
+    法令XMLの要素のバイト範囲を文書順に保持する。Articleは属性Numで検索できる
+
+    索引は拡張子.idxのTSVとして、lawhub-xmlのファイルはINDEX_DIRECTORY/lawhub-xml/{year}/{law_num}.idxに、
+    それ以外のファイルはINDEX_DIRECTORY/abs/以下に絶対パスを再現して保存する
+    先頭行にはXMLファイルのサイズ、更新日時、SHA-256を記録する。見出しのタブ、改行、バックスラッシュはエスケープする
+    読み込み時にはサイズと更新日時を比較し、異なる場合だけXMLファイルを読み込んでSHA-256を比較する
+    """
+
+    def __init__(self, size, mtime, digest, entries):
+        self.size = size
+        self.mtime = mtime  # st_mtime_ns of the xml file
+        self.digest = digest  # hex SHA-256 of the xml file
+        self.entries = entries
+        self.articles = dict()
+        duplicates = 0
+        for entry in entries:
+            if entry.tag != 'Article':
+                continue
+            if entry.num in self.articles:
+                duplicates += 1
+                continue
+            self.articles[entry.num] = entry
+        if duplicates:
+            LOGGER.warning(f'found {duplicates} Articles with duplicated Num, use the first one for each')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find_article(self, number):
+        """
+        Num属性がnumberのArticleを返す
+
+        :param number: e-govのNum属性（例: '12_2'）
+        """
+        if number not in self.articles:
+            raise KeyError(f'failed to find Article Num="{number}"')
+        return self.articles[number]
+
+    @staticmethod
+    def read(xml_fp, entry):
+        """
+        entryの要素のXMLをbytesで返す
+        """
+        with open(xml_fp, 'rb') as f:
+            f.seek(entry.start)
+            return f.read(entry.end - entry.start)
+
+    @classmethod
+    def build(cls, xml_fp):
+        """
+        XMLファイルを読み込んで索引を作成する
+        """
+        mtime = os.stat(xml_fp).st_mtime_ns
+        with open(xml_fp, 'rb') as f:
+            data = f.read()
+        return cls.from_bytes(data, mtime)
+
+    @classmethod
+    def from_bytes(cls, data, mtime=0):
+        return cls(len(data), mtime, compute_digest(data), _build_entries(data))
+
+    @staticmethod
+    def index_fp(xml_fp, directory=None):
+        """
+        :param directory: 索引を保存するディレクトリ。指定しなければINDEX_DIRECTORY
+        """
+        directory = Path(directory) if directory else INDEX_DIRECTORY
+        xml_fp = Path(xml_fp).resolve()
+        try:
+            fp = directory / 'lawhub-xml' / xml_fp.relative_to(LAWHUB_XML_DIRECTORY.resolve())
+        except ValueError:  # not in lawhub-xml
+            fp = directory / 'abs' / xml_fp.relative_to(xml_fp.anchor)
+        return fp.with_suffix(INDEX_SUFFIX)
+
+    def save(self, fp):
+        Path(fp).parent.mkdir(parents=True, exist_ok=True)
+        with open(fp, 'w', encoding='utf-8') as f:
+            f.write(f'{MAGIC}\t{VERSION}\t{self.size}\t{self.mtime}\t{self.digest}\n')
+            for entry in self.entries:
+                f.write('\t'.join(_escape(str(field)) for field in entry._fields()) + '\n')
+
+    @classmethod
+    def load(cls, fp):
+        with open(fp, encoding='utf-8') as f:
+            header = f.readline().rstrip('\n').split('\t')
+            if header[:2] != [MAGIC, VERSION] or len(header) != 5:
+                raise ValueError(f'invalid index header: {header}')
+            _, _, size, mtime, digest = header
+            entries = []
+            for line in f:
+                tag, num, parent, start, end, title, caption = map(_unescape, line.rstrip('\n').split('\t'))
+                entries.append(XmlIndexEntry(tag, num, int(parent), int(start), int(end), title, caption))
+        return cls(int(size), int(mtime), digest, entries)
+
+    @classmethod
+    def load_or_build(cls, xml_fp, directory=None):
+        """
+        保存された索引があれば読み込み、なければ（またはXMLファイルの内容が異なれば）作成して保存する
+
+        XMLファイルのサイズと更新日時が索引と一致すれば、XMLファイルは読み込まない
+
+        :param directory: 索引を保存するディレクトリ（index_fpを参照）
+        """
+        index_fp = cls.index_fp(xml_fp, directory)
+        stat = os.stat(xml_fp)
+        index = None
+        if index_fp.exists():
+            try:
+                index = cls.load(index_fp)
+            except Exception as e:
+                LOGGER.warning(f'failed to load {index_fp}: {e}')
+        if index is not None and index.size == stat.st_size and index.mtime == stat.st_mtime_ns:
+            return index
+
+        with open(xml_fp, 'rb') as f:
+            data = f.read()
+        if index is not None and index.size == len(data) and index.digest == compute_digest(data):
+            index.mtime = stat.st_mtime_ns  # touched without changing the content
+        else:
+            if index is not None:
+                LOGGER.debug(f'{index_fp} is outdated')
+            index = cls.from_bytes(data, stat.st_mtime_ns)
+        try:
+            index.save(index_fp)
+        except OSError as e:
+            LOGGER.debug(f'failed to save {index_fp}: {e}')
+        return index
+
+
+def compute_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _escape(text):
+    return re.sub(r'[\\\t\n]', lambda m: ESCAPES[m.group(0)], text)
+
+
+def _unescape(text):
+    return re.sub(r'\\[\\tn]', lambda m: UNESCAPES[m.group(0)], text)
+
+
+def _build_entries(data):
+    """
+    pyexpatのCurrentByteIndexから、MainProvisionと編・章・節・款・目の子要素のバイト範囲を計算する
+    見出しの要素（ChapterTitle, ArticleCaption, ArticleTitleなど）は記録せず、そのテキストを親の要素のtitleとcaptionに記録する
+    見出しとみなす要素はlawhub.law._count_xml_headersと同じで、テキストはElementTreeのtextと同様に最初の子要素の前までとする
+    """
+    entries = []
+    stack = []  # list of [tag, entry index or None, number of child elements, tag of the first child] from root to current element
+    state = {'last_start': None, 'text': None}  # position of the start tag, if no event occurred since then
+    chunks = []  # text of the title element being read, set to state['text'] as (entry index, field name)
+
+    parser = xml.parsers.expat.ParserCreate()
+
+    def flush_text():
+        if state['text'] is not None:
+            idx, field = state['text']
+            setattr(entries[idx], field, ''.join(chunks))
+            state['text'] = None
+            chunks.clear()
+
+    def on_start(tag, attrib):
+        flush_text()
+        idx = None
+        if stack:
+            parent = stack[-1]
+            parent[2] += 1
+            if parent[2] == 1:
+                parent[3] = tag
+            parent_tag, parent_idx, count, first_child_tag = parent
+            parent_entry_tag = entries[parent_idx].tag if parent_idx is not None else None
+            if parent_tag == 'MainProvision' and len(stack) == 3:
+                idx = len(entries)
+                entries.append(XmlIndexEntry(tag, attrib.get('Num', ''), -1, parser.CurrentByteIndex, -1))
+            elif parent_entry_tag in SECTION_TAGS:
+                if count == 1:
+                    state['text'] = (parent_idx, 'title')
+                else:
+                    idx = len(entries)
+                    entries.append(XmlIndexEntry(tag, attrib.get('Num', ''), parent_idx, parser.CurrentByteIndex, -1))
+            elif parent_entry_tag == 'Article':
+                if count == 1:
+                    state['text'] = (parent_idx, 'caption' if tag == 'ArticleCaption' else 'title')
+                elif count == 2 and first_child_tag == 'ArticleCaption':
+                    state['text'] = (parent_idx, 'title')
+        stack.append([tag, idx, 0, None])
+        state['last_start'] = parser.CurrentByteIndex
+
+    def on_end(tag):
+        flush_text()
+        _, idx, _, _ = stack.pop()
+        pos = parser.CurrentByteIndex
+        if idx is not None:
+            if state['last_start'] is not None and data[pos - 2:pos] == b'/>':  # empty element, e.g. <Article/>
+                entries[idx].end = pos
+            else:
+                entries[idx].end = data.index(b'>', pos) + 1
+        state['last_start'] = None
+
+    def on_data(text):
+        state['last_start'] = None
+        if state['text'] is not None:
+            chunks.append(text)
+
+    parser.StartElementHandler = on_start
+    parser.EndElementHandler = on_end
+    parser.CharacterDataHandler = on_data
+    parser.Parse(data, True)
+    return entries
@@ -141,12 +141,11 @@ class ApplyGianTask(BashTaskTemplate):
                 applied_fp = jsonl_fp.with_suffix('.applied')
                 failed_fp = jsonl_fp.with_suffix('.failed')
                 skipped_fp = jsonl_fp.with_suffix('.skipped')
+                diff_fp = jsonl_fp.with_suffix('.diff')
 
                 if law_fp.exists():
-                    before_cmd = f'cd {SCRIPT_ROOT} && ./apply_gian.py -l {law_fp} -o {before_fp}'
-                    after_cmd = f'cd {SCRIPT_ROOT} && ./apply_gian.py -l {law_fp} -o {after_fp} -g {jsonl_fp} --applied {applied_fp} --failed {failed_fp} --skipped {skipped_fp} -s {stat_fp}'
-                    self.commands.append(before_cmd)
-                    self.commands.append(after_cmd)
+                    cmd = f'cd {SCRIPT_ROOT} && ./apply_gian.py -l {law_fp} -b {before_fp} -o {after_fp} -g {jsonl_fp} --applied {applied_fp} --failed {failed_fp} --skipped {skipped_fp} -d {diff_fp} --offset -s {stat_fp}'
+                    self.commands.append(cmd)
 
 
 class VizGianTask(BashTaskTemplate):
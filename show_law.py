@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import sys
+
+from lawhub.constants import LOG_DATE_FORMAT, LOG_FORMAT
+from lawhub.fileutil import LawFinder
+from lawhub.law import LawDocument, LawNodeFinder
+from lawhub.query import Query
+
+LOGGER = logging.getLogger('show_law')
+
+
+def main(law_num, law_title, texts):
+    law_finder = LawFinder()
+    try:
+        xml_fp = law_finder.directory / law_finder.find_record(law_num, law_title)['fp']
+    except ValueError as e:
+        LOGGER.error(f'failed to find target law in lawhub-xml: {e}')
+        sys.exit(1)
+    LOGGER.info(f'found target law in lawhub-xml: {xml_fp}')
+
+    # load only articles to show, using the index of xml (see lawhub.xmlindex)
+    document = LawDocument.from_xml_fp(xml_fp, lazy=True)
+    finder = LawNodeFinder(document.nodes)
+    for text in texts:
+        nodes = finder.find(Query.from_text(text))
+        if not nodes:
+            LOGGER.error(f'failed to find {text} in {document.meta["LawTitle"]}')
+            sys.exit(1)
+        for node in nodes:
+            sys.stdout.write(f'{node}\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='lawhub-xmlの法令から指定した条や項だけを読み込み、TXT形式で出力する')
+    parser.add_argument('-n', '--num', help='法令番号（例: 平成二十九年法律第七十六号）')
+    parser.add_argument('-t', '--title', help='法令名')
+    parser.add_argument('query', nargs='+', help='出力する位置（例: 第二条第一項）')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, datefmt=LOG_DATE_FORMAT, format=LOG_FORMAT)
+
+    if not (args.num or args.title):
+        parser.error('either --num or --title is required')
+    main(args.num, args.title, args.query)
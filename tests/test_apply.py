@@ -2,7 +2,7 @@ from unittest import TestCase
 
 from lawhub.action import parse_action_text
 from lawhub.apply import apply_replace, TextNotFoundError, MultipleTextFoundError, apply_add_word, apply_delete
-from lawhub.law import Paragraph, LawNodeFinder
+from lawhub.law import Article, Paragraph, LawNodeFinder, iter_law_tree_text
 
 
 class TestApply(TestCase):
@@ -62,3 +62,24 @@ class TestApply(TestCase):
         with self.assertRaises(TextNotFoundError):
             apply_delete(action, node_finder)
         self.assertEqual('私はネコです', node.sentence)  # not changed
+
+    def test_apply_with_cache(self):
+        article = Article(title='第一条', children=[Paragraph(title='第一項', sentence='私はネコです')])
+        node_finder = LawNodeFinder([article])
+        self.assertEqual('第一条 私はネコです\n', ''.join(iter_law_tree_text(article, use_cache=True)))
+
+        apply_replace(parse_action_text('第一条第一項中「ネコ」を「イヌ」に改める'), node_finder)
+        self.assertEqual('第一条 私はイヌです\n', ''.join(iter_law_tree_text(article, use_cache=True)))
+
+    def test_apply_with_snapshot(self):
+        articles = [Article(title='第一条', children=[Paragraph(title='第一項', sentence='私はネコです')]),
+                    Article(title='第二条', children=[Paragraph(title='第一項', sentence='私はイヌです')])]
+        node_finder = LawNodeFinder(articles)
+        snapshot = node_finder.snapshot()
+        texts = [''.join(iter_law_tree_text(node, use_cache=True)) for node in snapshot]
+
+        apply_replace(parse_action_text('第一条第一項中「ネコ」を「トラ」に改める'), node_finder)
+        apply_add_word(parse_action_text('第一条第一項中「トラ」の下に「の子」を加える'), node_finder)
+        self.assertEqual(texts, [''.join(iter_law_tree_text(node, use_cache=True)) for node in snapshot])
+        self.assertEqual('第一条 私はトラの子です\n', ''.join(iter_law_tree_text(node_finder.nodes[0], use_cache=True)))
+        self.assertIs(snapshot[1], node_finder.nodes[1])
@@ -0,0 +1,57 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from lawhub.cache import LawTreeCache
+from lawhub.law import LawDocument
+
+
+class TestLawTreeCache(TestCase):
+    def setUp(self):
+        self.tmp_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_directory.name)
+
+    def tearDown(self):
+        self.tmp_directory.cleanup()
+
+    def test_load(self):
+        fp = './resource/egov.xml'
+        expected = LawDocument.from_xml_fp(fp)
+
+        cache = LawTreeCache(self.directory, max_size=2 ** 20)
+        for i in range(2):
+            document = LawDocument.from_xml_fp(fp, cache=cache)
+            self.assertEqual(expected.meta, document.meta)
+            self.assertEqual([node.serialize() for node in expected.nodes], [node.serialize() for node in document.nodes])
+        self.assertEqual(1, cache.miss_count)
+        self.assertEqual(1, cache.hit_count)
+        self.assertEqual(1, len(list(cache.directory.glob('*.bin'))))
+
+    def test_evict(self):
+        fps = []
+        for i in range(3):
+            fp = self.directory / f'{i}.xml'
+            fp.write_text(Path('./resource/egov.xml').read_text().replace('第一条', f'第{"一二三"[i]}条の{i}'))
+            fps.append(fp)
+        size = len(LawTreeCache.encode(LawDocument.from_xml_fp(fps[0])))
+
+        cache = LawTreeCache(self.directory / 'cache', max_size=int(size * 2.5))
+        for fp in fps:
+            cache.load(fp)
+        self.assertEqual(2, len(list(cache.directory.glob('*.bin'))))
+        cache.load(fps[2])
+        self.assertEqual(1, cache.hit_count)
+
+    def test_parser_version(self):
+        old_cache = LawTreeCache(self.directory, parser_version='old')
+        old_cache.load('./resource/egov.xml')
+        self.assertTrue(old_cache.directory.exists())
+
+        other_directory = self.directory / 'other'
+        other_directory.mkdir()
+        (other_directory / 'data.txt').write_text('not a cache')
+        new_cache = LawTreeCache(self.directory, parser_version='new')
+        self.assertFalse(old_cache.directory.exists())
+        self.assertTrue((other_directory / 'data.txt').exists())  # not created by LawTreeCache
+        new_cache.load('./resource/egov.xml')
+        self.assertEqual(0, new_cache.hit_count)
@@ -1,9 +1,16 @@
+import io
+import os
+import re
+import tempfile
 import xml.etree.ElementTree as ET
 from unittest import TestCase
 
-from lawhub.law import LawHierarchy, parse_xml, Article, Chapter, sort_law_tree, Section, INDENT, SPACE, Paragraph, LawTreeBuilder, Item, line_to_law_node, LawNodeFinder, extract_target_law_meta
+from lawhub.law import LawHierarchy, parse_xml, parse_xml_fp, LawDocument, extract_law_meta, extract_text_from_sentence, save_law_tree, iter_law_tree_text, Article, Chapter, sort_law_tree, Section, INDENT, SPACE, Paragraph, LawTreeBuilder, Item, line_to_law_node, LawNodeFinder, extract_target_law_meta, Part, \
+    classify_hierarchy, title_to_hierarchy, law_tree_digest, diff_law_tree, LawNodeChangeType, \
+    build_address_index, load_law_tree_offsets, iter_law_tree_text_with_offsets
 from lawhub.query import Query
 from lawhub.serializable import is_serializable
+from lawhub.xmlbackend import available_backends, get_backend
 
 
 class TestLaw(TestCase):
@@ -13,6 +20,250 @@ class TestLaw(TestCase):
             tree = parse_xml(node)
             self.assertTrue(is_serializable(tree))
 
+    def test_parse_xml_fp(self):
+        fp = './resource/egov.xml'
+        main = ET.parse(fp).getroot().find('LawBody').find('MainProvision')
+        expected = [parse_xml(node) for node in main]
+        nodes = parse_xml_fp(fp)
+        self.assertEqual(18, len(nodes))
+        self.assertEqual(list(map(str, expected)), list(map(str, nodes)))
+        self.assertEqual([node.serialize() for node in expected], [node.serialize() for node in nodes])
+
+    def test_law_document(self):
+        fp = './resource/egov.xml'
+        document = LawDocument.from_xml_fp(fp)
+        self.assertEqual(extract_law_meta(fp), document.meta)
+        self.assertEqual('平成二十九年法律第七十六号', document.meta['LawNum'])
+        self.assertEqual('Heisei', document.meta['Era'])
+        self.assertEqual(list(map(str, parse_xml_fp(fp))), list(map(str, document.nodes)))
+
+    def test_extract_law_meta(self):
+        fp = './resource/egov.xml'
+        root = ET.parse(fp).getroot()
+        expected = {'LawNum': root.find('LawNum').text, 'LawTitle': root.find('LawBody').find('LawTitle').text}
+        expected.update(root.attrib)
+        with open(fp, 'rb') as f:
+            data = f.read()
+        for backend in available_backends():
+            self.assertEqual(expected, extract_law_meta(fp, get_backend(backend)))
+            # stop reading after LawTitle
+            truncated = data[:data.index(b'</LawTitle>') + len(b'</LawTitle>')] + b'<broken'
+            self.assertEqual(expected, extract_law_meta(io.BytesIO(truncated), get_backend(backend)))
+            with self.assertRaises(ValueError):
+                extract_law_meta(io.BytesIO(b'<Law><LawNum>1</LawNum><LawBody/></Law>'), get_backend(backend))
+
+    def test_extract_text_from_sentence(self):
+        def extract_text_by_tostring(node):
+            text = ET.tostring(node, encoding="unicode")
+            text = text.replace('\n', '')
+            text = re.sub(r'<Ruby>([^<>]*)<Rt>([^<>]*)</Rt></Ruby>', r'\1', text)
+            text = re.sub(r'<[^<>]*>', '', text)
+            return text.strip()
+
+        fp = './resource/law.xml'
+        sentences = ET.parse(fp).getroot().findall('.//Sentence')
+        self.assertEqual(58, len(sentences))
+        for node in sentences:
+            self.assertEqual(extract_text_by_tostring(node), extract_text_from_sentence(node))
+
+        for xml in ['<Sentence>\n  本文\n</Sentence>',
+                    '<Sentence><Ruby>漢<Rt>かん</Rt></Ruby><Ruby>字<Rt>じ</Rt></Ruby>を<Sup>含む</Sup>。</Sentence>',
+                    '<Sentence><Ruby>漢字<Rt>かん</Rt>\n</Ruby>、<Ruby>字<Rt>じ</Rt>余り</Ruby></Sentence>',
+                    '<Sentence>A&amp;B &lt;注&gt;</Sentence>']:
+            node = ET.fromstring(xml)
+            self.assertEqual(extract_text_by_tostring(node), extract_text_from_sentence(node))
+        self.assertEqual('漢字を含む。', extract_text_from_sentence(ET.fromstring(
+            '<Sentence><Ruby>漢<Rt>かん</Rt></Ruby><Ruby>字<Rt>じ</Rt></Ruby>を<Sup>含む</Sup>。</Sentence>')))
+
+    def test_save_law_tree(self):
+        nodes = parse_xml_fp('./resource/egov.xml')
+        expected = '鯨類科学調査法\n\n' + ''.join(map(lambda node: f'{node}\n', nodes))
+        with tempfile.TemporaryDirectory() as directory:
+            for buffer_size in [1, 2 ** 13]:
+                fp = os.path.join(directory, f'{buffer_size}.txt')
+                save_law_tree('鯨類科学調査法', nodes, fp, buffer_size=buffer_size)
+                with open(fp, 'r') as f:
+                    self.assertEqual(expected, f.read())
+
+    def test_save_law_tree_offsets(self):
+        article = Article(title='第一条', caption='（テスト）', children=[
+            Paragraph(number=1, sentence='第一項', children=[Item(title='一', sentence='第一号')]),
+            Paragraph(number=2, sentence='第二項')
+        ])
+        nodes = [Chapter(title='第一章', children=[article, Article(title='第二条')]), Chapter(title='第二章')]
+        with tempfile.TemporaryDirectory() as directory:
+            fp = os.path.join(directory, 'law.txt')
+            offset_fp = os.path.join(directory, 'law.txt.offset')
+            save_law_tree('テスト法', nodes, fp, buffer_size=1, offset_fp=offset_fp)
+            with open(fp, 'rb') as f:
+                data = f.read()
+            offsets = load_law_tree_offsets(offset_fp)
+
+        self.assertEqual(''.join(map(lambda node: f'{node}\n', nodes)), data.decode('utf-8')[len('テスト法\n\n'):])
+        self.assertEqual(['Ch1', 'Ch1/A1', 'Ch1/A1/P1', 'Ch1/A1/P1/I1', 'Ch1/A1/P2', 'Ch1/A2', 'Ch2'], list(offsets))
+        index = build_address_index(nodes)
+        for address, (start_line, end_line, start, end) in offsets.items():
+            self.assertEqual(str(index[address]), data[start:end].decode('utf-8'))
+            self.assertEqual(start_line, data[:start].count(b'\n') + 1)
+        self.assertEqual((3, 9), offsets['Ch1'][:2])
+        self.assertEqual((4, 7), offsets['Ch1/A1'][:2])  # caption to the last paragraph
+        self.assertEqual((5, 6), offsets['Ch1/A1/P1'][:2])  # first paragraph starts in the line of article title
+        self.assertEqual((12, 12), offsets['Ch2'][:2])
+
+    def test_iter_law_tree_text_with_offsets_cache(self):
+        nodes = parse_xml_fp('./resource/egov.xml')
+        nodes.append(Chapter(title='\n', children=[Article(title='', children=[Paragraph(number=1, sentence='\n'), Paragraph(number=2, sentence='')])]))
+        finder = LawNodeFinder(nodes)
+        expected = []
+        text = ''.join(iter_law_tree_text_with_offsets(nodes, expected, 'テスト法\n\n'))
+        for i in range(2):
+            offsets = []
+            self.assertEqual(text, ''.join(iter_law_tree_text_with_offsets(nodes, offsets, 'テスト法\n\n', use_cache=True)))
+            self.assertEqual(expected, offsets)
+
+        node = finder.find(Query.from_text('第二条第一項'))[0]
+        node.sentence = node.sentence + '\n'
+        finder.mark_dirty(node)
+        expected = []
+        text = ''.join(iter_law_tree_text_with_offsets(nodes, expected, 'テスト法\n\n'))
+        offsets = []
+        self.assertEqual(text, ''.join(iter_law_tree_text_with_offsets(nodes, offsets, 'テスト法\n\n', use_cache=True)))
+        self.assertEqual(expected, offsets)
+
+    def test_iter_law_tree_text(self):
+        article = Article(title='第一条', caption='（テスト）', children=[
+            Paragraph(number=1, sentence='第一項', children=[Item(title='一', sentence='第一号')]),
+            Paragraph(number=2, sentence='第二項')
+        ])
+        chapter = Chapter(title='第一章', children=[article, Article(title='第二条')])
+        expected = '第一章\n（テスト）\n第一条 第一項\n' + INDENT + '一 第一号\n2 第二項\n\n第二条\n\n'
+        self.assertEqual(expected, ''.join(iter_law_tree_text(chapter)))
+        self.assertEqual(expected, str(chapter))
+
+    def test_iter_law_tree_text_cache(self):
+        nodes = parse_xml_fp('./resource/egov.xml')
+        finder = LawNodeFinder(nodes)
+        self.assertEqual(list(map(str, nodes)), [''.join(iter_law_tree_text(node, use_cache=True)) for node in nodes])
+
+        node = finder.find(Query.from_text('第二条第一項'))[0]
+        other = finder.find(Query.from_text('第三条'))[0]
+        cached_text = other._text
+        node.sentence = '変更後'
+        finder.mark_dirty(node)
+        self.assertIsNone(finder.find(Query.from_text('第二条'))[0]._text)
+        self.assertEqual(list(map(str, nodes)), [''.join(iter_law_tree_text(node, use_cache=True)) for node in nodes])
+        self.assertIs(cached_text, other._text)
+
+    def test_digest(self):
+        fp = './resource/egov.xml'
+        nodes = parse_xml_fp(fp)
+        self.assertEqual([node.digest() for node in nodes], [node.digest() for node in parse_xml_fp(fp)])
+        self.assertEqual(law_tree_digest(nodes), law_tree_digest(parse_xml_fp(fp)))
+        self.assertNotEqual(nodes[0].digest(), nodes[1].digest())
+
+        finder = LawNodeFinder(nodes)
+        node = finder.find(Query.from_text('第二条第一項'))[0]
+        article_digest = finder.find(Query.from_text('第二条'))[0].digest()
+        other_digest = finder.find(Query.from_text('第三条'))[0].digest()
+        law_digest = law_tree_digest(nodes)
+        node.sentence = '変更後'
+        finder.mark_dirty(node)
+        self.assertNotEqual(article_digest, finder.find(Query.from_text('第二条'))[0].digest())
+        self.assertEqual(other_digest, finder.find(Query.from_text('第三条'))[0].digest())
+        self.assertNotEqual(law_digest, law_tree_digest(nodes))
+
+        # digest depends on the order of children and the class of nodes
+        articles = [Article(number='2'), Article(number='1')]
+        chapter = Chapter(title='第一章', children=articles)
+        self.assertNotEqual(Chapter(title='第一章', children=articles[::-1]).digest(), chapter.digest())
+        self.assertNotEqual(Section(title='第一章').digest(), Chapter(title='第一章').digest())
+        sort_law_tree(chapter)
+        self.assertEqual(Chapter(title='第一章', children=list(articles)).digest(), chapter.digest())
+
+    def test_diff_law_tree(self):
+        fp = './resource/egov.xml'
+        before = parse_xml_fp(fp)
+        after = parse_xml_fp(fp)
+        self.assertEqual([], diff_law_tree(before, after))
+
+        finder = LawNodeFinder(after)
+        node = finder.find(Query.from_text('第二条第一項'))[0]
+        node.sentence = '変更後'
+        finder.mark_dirty(node)
+        article = finder.find(Query.from_text('第三条'))[0]
+        article.children.append(Paragraph(number=len(article.children) + 1, sentence='追加'))
+        finder.mark_dirty(article)
+        del after[4]
+
+        changes = diff_law_tree(before, after)
+        self.assertEqual([LawNodeChangeType.CHANGED, LawNodeChangeType.INSERTED, LawNodeChangeType.DELETED],
+                         [change.type for change in changes])
+        self.assertEqual(('第二条', '第一項'), changes[0].path)
+        self.assertEqual('変更後', changes[0].after.sentence)
+        self.assertEqual(('第二条',), changes[0].article_path())
+        self.assertIsNone(changes[1].before)
+        self.assertEqual('追加', changes[1].after.sentence)
+        self.assertEqual(('第五条',), changes[2].path)
+        self.assertEqual({'type': 'deleted', 'path': '第五条', 'before': before[4]._str_head(), 'after': None}, changes[2].to_dict())
+
+        # nodes with the same title are aligned in order
+        before = [Article(title='第一条'), Article(title='第一条', caption='（旧）')]
+        after = [Article(title='第一条'), Article(title='第一条', caption='（新）')]
+        self.assertEqual([('第一条',)], [change.path for change in diff_law_tree(before, after)])
+        self.assertEqual('（新）', diff_law_tree(before, after)[0].after.caption)
+
+    def test_address(self):
+        self.assertEqual('A12_2', line_to_law_node('第十二条の二 本文').key)
+        self.assertEqual('12_2', line_to_law_node('第十二条の二 本文').number)
+        self.assertEqual('P3', line_to_law_node('3 本文').key)
+        self.assertEqual('I5', line_to_law_node('第五号 本文').key)
+        self.assertEqual('Sa2', line_to_law_node('ロ 本文').key)
+        self.assertEqual('Sb2', line_to_law_node('（２） 本文').key)
+        self.assertEqual('Ch2_3', Chapter(title='第二章の三').key)
+        self.assertEqual('A226:227', Article(title='第二百二十六条及び第二百二十七条', number='226:227').key)
+
+        nodes = parse_xml_fp('./resource/egov.xml')
+        index = build_address_index(nodes)
+        self.assertIs(nodes[1], index['A2'])
+        self.assertIs(nodes[1].children[0], index['A2/P1'])
+        finder = LawNodeFinder(nodes)
+        for address, text in [('A2/P1', '第二条第一項'), ('A3', '第三条')]:
+            self.assertIs(finder.find(Query.from_text(text))[0], finder.find_by_address(address))
+        self.assertIsNone(finder.find_by_address('A100'))
+
+        chapter = Chapter(title='第一章', children=[Article(title='第一条'), Article(title='第一条')])
+        self.assertEqual(['Ch1', 'Ch1/A1', 'Ch1/A1~2'], list(build_address_index([chapter])))
+
+    def test_copy_on_write(self):
+        fp = './resource/egov.xml'
+        expected = list(map(str, parse_xml_fp(fp)))
+        nodes = parse_xml_fp(fp)
+        finder = LawNodeFinder(nodes)
+        snapshot = finder.snapshot()
+        self.assertIs(nodes, snapshot)
+
+        node = finder.find(Query.from_text('第二条第一項'))[0]
+        copied = finder.copy_on_write(node)
+        self.assertIsNot(node, copied)
+        self.assertIs(copied, finder.copy_on_write(copied))  # already copied
+        copied.sentence = '変更後'
+        finder.mark_dirty(copied)
+        self.assertIs(copied, finder.find(Query.from_text('第二条第一項'))[0])
+        self.assertIs(copied, finder.find_by_address('A2/P1'))
+        self.assertEqual(expected, list(map(str, snapshot)))
+        self.assertIsNot(snapshot, finder.nodes)
+        self.assertIs(snapshot[2], finder.nodes[2])  # only the path to the modified node is copied
+        self.assertIs(snapshot[1].children[1], finder.nodes[1].children[1])
+        self.assertEqual([('第二条', '第一項')], [change.path for change in diff_law_tree(snapshot, finder.nodes)])
+
+        # nodes copied before the next snapshot are copied again
+        second = finder.snapshot()
+        node = finder.copy_on_write(finder.find(Query.from_text('第二条第一項'))[0])
+        node.sentence = '再変更後'
+        self.assertEqual('変更後', second[1].children[0].sentence)
+        self.assertEqual('再変更後', finder.nodes[1].children[0].sentence)
+        self.assertEqual(expected[1], str(snapshot[1]))
+
     def test_sort_law_tree(self):
         articles = [Article(number='2'), Article(number='3'), Article(number='1')]
         sections = [Section(title='第一節', children=articles)]
@@ -24,6 +275,20 @@ class TestLaw(TestCase):
         self.assertEqual('2', articles[1].number)
         self.assertEqual('3', articles[2].number)
 
+        # digest of ancestors are also updated
+        def build():
+            return Part(title='第一編', children=[Chapter(title='第一章', children=[
+                Article(title='第一条', children=[Paragraph(number=2, sentence='二'), Paragraph(number=1, sentence='一')])])])
+
+        part = build()
+        digest = part.digest()
+        self.assertTrue(sort_law_tree(part))
+        expected = build()
+        sort_law_tree(expected)
+        self.assertNotEqual(digest, part.digest())
+        self.assertEqual(expected.digest(), part.digest())
+        self.assertFalse(sort_law_tree(part))
+
     def test_extract_law_hierarchy(self):
         string = '第七十五条の二の二第五項第三号イ（２）の表'
         self.assertEqual('第七十五条の二の二', LawHierarchy.ARTICLE.extract(string))
@@ -41,11 +306,40 @@ class TestLaw(TestCase):
         self.assertEqual('第一項', LawHierarchy.PARAGRAPH.extract(string, allow_placeholder=False))
         self.assertEqual('', LawHierarchy.PARAGRAPH.extract(string, allow_partial_match=False))
 
+    def test_classify_hierarchy(self):
+        self.assertEqual((LawHierarchy.ARTICLE, '第七十五条の二の二'), classify_hierarchy('第七十五条の二の二'))
+        self.assertEqual((LawHierarchy.SUBITEM2, '（２）'), classify_hierarchy('（２）'))
+        self.assertEqual((None, ''), classify_hierarchy('同条'))
+        self.assertEqual((LawHierarchy.ARTICLE, '同条'), classify_hierarchy('同条', allow_placeholder=True))
+        self.assertEqual((None, ''), classify_hierarchy('同条第一項', allow_placeholder=True))
+        self.assertEqual((LawHierarchy.ARTICLE, '同条'), classify_hierarchy('同条第一項', allow_placeholder=True, allow_partial_match=True))
+        self.assertEqual((LawHierarchy.PARAGRAPH, '第一項'), classify_hierarchy('同条第一項', allow_partial_match=True))
+
+    def test_title_to_hierarchy(self):
+        self.assertEqual(LawHierarchy.CHAPTER, title_to_hierarchy('第一章'))
+        self.assertEqual(LawHierarchy.ARTICLE, title_to_hierarchy('第十二条の二'))
+        self.assertEqual(LawHierarchy.PARAGRAPH, title_to_hierarchy('２'))
+        self.assertEqual(LawHierarchy.ITEM, title_to_hierarchy('一の二'))
+        self.assertEqual(LawHierarchy.SUBITEM1, title_to_hierarchy('イ'))
+        self.assertEqual(LawHierarchy.SUBITEM4, title_to_hierarchy('（イ）'))
+        self.assertEqual(LawHierarchy.SUPPLEMENT, title_to_hierarchy('附則'))
+        self.assertIsNone(title_to_hierarchy('同条'))
+        self.assertIsNone(title_to_hierarchy('第一条第二項'))
+
     def test_get_child_hierarchy_list(self):
         self.assertEqual(
             [LawHierarchy.ITEM, LawHierarchy.SUBITEM1, LawHierarchy.SUBITEM2, LawHierarchy.SUBITEM3, LawHierarchy.SUBITEM4, LawHierarchy.TABLE],
             LawHierarchy.PARAGRAPH.children()
         )
+        self.assertEqual([LawHierarchy.SUBITEM4, LawHierarchy.TABLE], LawHierarchy.SUBITEM4.children(include_self=True))
+        self.assertEqual([], LawHierarchy.TABLE.children())
+
+    def test_hierarchy_rank(self):
+        self.assertEqual(list(range(len(LawHierarchy))), [hrchy.rank for hrchy in LawHierarchy])
+        self.assertEqual(LawHierarchy.CONTENTS, LawHierarchy.first())
+        self.assertEqual(LawHierarchy.TABLE, LawHierarchy.last())
+        mask = LawHierarchy.SUBITEM3.child_mask()
+        self.assertEqual([LawHierarchy.SUBITEM4, LawHierarchy.TABLE], [hrchy for hrchy in LawHierarchy if mask >> hrchy.rank & 1])
 
     def test_extract_target_law_meta(self):
         text = '地方税法（昭和二十五年法律第二百二十六号）の一部を次のように改正する。'
@@ -80,6 +374,7 @@ class TestLaw(TestCase):
         self.assertEqual('（登記簿等の持出禁止）', article.caption)
         self.assertEqual('第七条の二', article.title)
         self.assertEqual('7_2', article.number)
+        self.assertEqual((7, 2), article.sort_key)
         self.assertEqual(0, len(article.children))
         self.assertEqual('（登記簿等の持出禁止）\n第七条の二\n', str(article))
         self.assertTrue(is_serializable(article))
@@ -89,6 +384,9 @@ class TestLaw(TestCase):
         self.assertTrue(Article(number='2_1') < Article(number='2_2'))
         self.assertTrue(Article(number='2_1') < Article(number='2_10'))
         self.assertTrue(Article(number='2') < Article(number='2_1'))
+        self.assertTrue(Article(number='226:227') < Article(number='226_228'))
+        self.assertEqual((1,), Chapter(title='第一章　総則').sort_key)
+        self.assertEqual((3, 2), Item(title='三の二').sort_key)
 
     def test_paragraph(self):
         fp = './resource/paragraph.xml'
@@ -109,6 +407,16 @@ class TestLaw(TestCase):
         self.assertEqual(INDENT + '一' + SPACE + 'ほどほどに頑張ること。', str(item))
         self.assertTrue(is_serializable(item))
 
+    def test_node_slots(self):
+        paragraphs = [Paragraph(number=2, sentence='これは第二項です。'), Paragraph(number=2, sentence='これも第二項です。')]
+        self.assertFalse(hasattr(paragraphs[0], '__dict__'))
+        self.assertIs(paragraphs[0].title, paragraphs[1].title)
+        self.assertTrue(is_serializable(paragraphs[0]))
+
+        item = Item(title='一', sentence='これは第一号です。')
+        self.assertFalse(hasattr(item, '__dict__'))
+        self.assertEqual({'title': '第一号', 'children': [], 'sentence': 'これは第一号です。'}, item.to_dict()['__dict__'])
+
     def test_line_to_law_node(self):
         self.assertEqual(
             Article(title='第一条', children=Paragraph(title='第一項', number=1, sentence='これは第一項です。')),
@@ -174,6 +482,16 @@ class TestLawTreeBuilder(TestCase):
         self.assertEqual('第二条第一項', paragraph3.sentence)
         self.assertEqual(0, len(paragraph3.children))
 
+    def test_law_tree_builder_deep(self):
+        node = Article(title='第一条')
+        for _ in range(5000):
+            node = Article(title='第一条', children=[node])
+
+        builder = LawTreeBuilder()
+        builder.add(node)
+        output_nodes = builder.build()
+        self.assertEqual(5001, len(output_nodes))
+
     def test_law_tree_builder_empty(self):
         builder = LawTreeBuilder()
         self.assertEqual(list(), builder.build())
@@ -221,3 +539,18 @@ class TestLawNodeFinder(TestCase):
         finder = LawNodeFinder(self.build_sample_law_tree())
         self.assertEqual(0, len(finder.find(Query.from_text('第一条第一号イ'))))
         self.assertEqual(0, len(finder.find(Query.from_text('第三条'))))
+
+    def test_law_node_finder_prefix(self):
+        nodes = [Article(title='第一条の二', children=[Paragraph(title='第一項', number=1, sentence='第一条の二第一項')]),
+                 Article(title='第一条', children=[Paragraph(title='第一項', number=1, sentence='第一条第一項')])]
+        finder = LawNodeFinder(nodes)
+        self.assertEqual('第一条の二第一項', finder.find(Query.from_text('第一条第一項'))[0].sentence)  # same as title.startswith
+        self.assertEqual('第一条の二第一項', finder.find(Query.from_text('第一条の二第一項'))[0].sentence)
+        self.assertEqual(nodes, finder.find(Query.from_text('')))
+
+    def test_law_node_finder_after_update(self):
+        finder = LawNodeFinder(self.build_sample_law_tree())
+        query = Query.from_text('第一条第二項')
+        finder.find(query)[0].sentence = '変更後'
+        self.assertEqual('変更後', finder.find(query)[0].sentence)
+        self.assertEqual('第二条第一項', finder.find(Query.from_text('第二条第一項'))[0].sentence)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from lawhub.law import LawDocument, parse_xml_fp, save_law_tree, LawNodeFinder, Chapter, Article, Paragraph, Item, Subitem1, Subitem2, BaseLawClass
+from lawhub.lawtree import FlatLawTree, LawCorpus, LawCorpusWriter
+from lawhub.query import Query
+
+
+class TestFlatLawTree(TestCase):
+    @staticmethod
+    def build_sample_nodes():
+        nodes = parse_xml_fp('./resource/egov.xml')
+        nodes.append(Chapter(title='第二章', children=[
+            Article(title='第二十条', caption='（テスト）', number='20', children=[
+                Paragraph(number=1, sentence='第二十条第一項', children=[
+                    Item(title='一', sentence='第二十条第一項第一号', children=[
+                        Subitem1(title='イ', sentence='イ', children=[Subitem2(title='（１）', sentence='（１）')])
+                    ]),
+                    BaseLawClass(title='<表略>')
+                ]),
+                Paragraph(number=2, sentence='第二十条第二項')
+            ])
+        ]))
+        return nodes
+
+    def test_from_nodes(self):
+        nodes = self.build_sample_nodes()
+        tree = FlatLawTree.from_nodes(nodes)
+        self.assertEqual(19, len(list(tree.roots())))
+        self.assertEqual([node.serialize() for node in nodes], [node.serialize() for node in tree.to_nodes()])
+        self.assertEqual(list(map(str, nodes)), [tree.render(idx) for idx in tree.roots()])
+
+    def test_from_xml_fp(self):
+        fp = './resource/egov.xml'
+        tree = FlatLawTree.from_xml_fp(fp)
+        self.assertEqual([node.serialize() for node in parse_xml_fp(fp)], [node.serialize() for node in tree.to_nodes()])
+
+    def test_save(self):
+        nodes = self.build_sample_nodes()
+        tree = FlatLawTree.from_nodes(nodes)
+        with tempfile.TemporaryDirectory() as directory:
+            expected_fp = os.path.join(directory, 'expected.txt')
+            actual_fp = os.path.join(directory, 'actual.txt')
+            save_law_tree('テスト法', nodes, expected_fp)
+            tree.save('テスト法', actual_fp)
+            with open(expected_fp, 'r') as f1, open(actual_fp, 'r') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def test_find(self):
+        nodes = self.build_sample_nodes()
+        tree = FlatLawTree.from_nodes(nodes)
+        finder = LawNodeFinder(nodes)
+        for text in ['第三条第一項第二号', '第二条第二項', '第二十条第一項第一号イ（１）', '第二章', '第九十九条', '第三条第三号イ']:
+            query = Query.from_text(text)
+            expected = [node.serialize() for node in finder.find(query)]
+            actual = [tree.to_node(idx).serialize() for idx in tree.find(query)]
+            self.assertEqual(expected, actual)
+
+    def test_to_bytes(self):
+        nodes = self.build_sample_nodes()
+        data = FlatLawTree.from_nodes(nodes).to_bytes()
+        tree = FlatLawTree.from_bytes(memoryview(data))
+        self.assertEqual([node.serialize() for node in nodes], [node.serialize() for node in tree.to_nodes()])
+        self.assertEqual(data, tree.to_bytes())
+        with self.assertRaises(ValueError):
+            FlatLawTree.from_bytes(data[:-1])
+
+
+class TestLawCorpus(TestCase):
+    def test_corpus(self):
+        fp = './resource/egov.xml'
+        document = LawDocument.from_xml_fp(fp)
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_fp = os.path.join(directory, 'corpus.bin')
+            with LawCorpusWriter(corpus_fp) as writer:
+                writer.add('egov', document.meta, FlatLawTree.from_nodes(document.nodes))
+                writer.add('empty', {}, FlatLawTree.from_nodes([]))
+                with self.assertRaises(ValueError):
+                    writer.add('egov', document.meta, FlatLawTree.from_nodes(document.nodes))
+            self.assertEqual(['corpus.bin'], os.listdir(directory))
+
+            with LawCorpus.open(corpus_fp) as corpus:
+                self.assertEqual(2, len(corpus))
+                self.assertIn('egov', corpus)
+                self.assertEqual(document.meta, corpus.get_meta('egov'))
+                tree = corpus.get_tree('egov')
+                self.assertEqual(list(map(str, document.nodes)), [tree.render(idx) for idx in tree.roots()])
+                del tree
+                self.assertEqual([], corpus.get_document('empty').nodes)
+                actual = corpus.get_document('egov')
+                self.assertEqual([node.serialize() for node in document.nodes], [node.serialize() for node in actual.nodes])
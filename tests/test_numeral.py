@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+import kanjize
+
+from lawhub.numeral import int2kanji, kanji2int, title_to_sort_key, number_to_sort_key
+
+
+class TestNumeral(TestCase):
+    def test_int2kanji(self):
+        self.assertEqual('十二', int2kanji(12))
+        self.assertEqual('千百十一', int2kanji(1111))
+        self.assertEqual('一万二千', int2kanji(12000))
+        for number in [0, 1, 10, 101, 9999, 10000, 10001, 123456, 10 ** 8 + 1]:
+            self.assertEqual(kanjize.int2kanji(number), int2kanji(number))
+
+    def test_kanji2int(self):
+        self.assertEqual(12, kanji2int('十二'))
+        self.assertEqual(12000, kanji2int('一万二千'))
+        self.assertEqual(10, kanji2int('一十'))  # not in the table
+        with self.assertRaises(ValueError):
+            kanji2int('条')
+
+    def test_title_to_sort_key(self):
+        self.assertEqual((12, 2), title_to_sort_key('第十二条の二'))
+        self.assertEqual((1, 2, 3), title_to_sort_key('第一編の二の三'))
+        self.assertEqual((3,), title_to_sort_key('第三項'))
+        self.assertEqual((2,), title_to_sort_key('ロ'))
+        self.assertEqual((12,), title_to_sort_key('（１２）'))
+        self.assertEqual((4,), title_to_sort_key('（ｉｖ）'))
+        self.assertEqual((), title_to_sort_key('附則'))
+
+    def test_number_to_sort_key(self):
+        self.assertEqual((12, 2), number_to_sort_key('12_2'))
+        self.assertEqual((226, 227), number_to_sort_key('226:227'))
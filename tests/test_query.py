@@ -19,6 +19,14 @@ class TestQuery(TestCase):
         self.assertTrue(is_serializable(query))
         print(query.serialize())
 
+    def test_init_hierarchy_map(self):
+        texts = ['第一条の二第三項第四号イ（１）(ii)（ホ）', '（イ）', '同目次', '別表第一', '附則第二条', '同条同項']
+        with open('./resource/gian.txt') as f:
+            texts += [line.strip() for line in f]
+        for text in texts:
+            expected = [(hrchy.name, hrchy.extract(text)) for hrchy in LawHierarchy if hrchy.extract(text)]
+            self.assertEqual(expected, list(Query.from_text(text).hierarchy_map.items()))
+
 
 class TestQueryCompensator(TestCase):
     def test_compensate_success(self):
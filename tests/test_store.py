@@ -0,0 +1,63 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from lawhub.action import parse_action_text
+from lawhub.apply import apply_replace
+from lawhub.law import LawDocument
+from lawhub.store import LawStore
+
+
+class TestLawStore(TestCase):
+    def setUp(self):
+        self.tmp_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_directory.name)
+        records = []
+        for i in range(3):
+            fp = self.directory / f'{i}.xml'
+            text = Path('./resource/egov.xml').read_text()
+            fp.write_text(text.replace('平成二十九年法律第七十六号', f'平成二十九年法律第{"一二三"[i]}号')
+                          .replace('商業捕鯨', f'商業捕鯨{i}'))
+            records.append(f'{fp.name}\t平成二十九年法律第{"一二三"[i]}号\t{LawDocument.from_xml_fp(fp).meta["LawTitle"]}\n')
+        shutil.copy('./resource/egov.xml', self.directory / 'dup.xml')
+        records.append(f'dup.xml\t平成二十九年法律第三号\tdup\n')
+        with open(self.directory / 'index.tsv', 'w') as f:
+            f.write('fp\tLawNum\tLawTitle\n')
+            f.writelines(records)
+        self.size = (self.directory / '0.xml').stat().st_size
+
+    def tearDown(self):
+        self.tmp_directory.cleanup()
+
+    def test_get(self):
+        store = LawStore(self.directory)
+        document = store.get(law_num='平成二十九年法律第一号')
+        self.assertEqual('平成二十九年法律第一号', document.meta['LawNum'])
+        self.assertIs(document, store.get(law_title=document.meta['LawTitle']))
+        self.assertEqual(1, store.miss_count)
+        self.assertEqual(1, store.hit_count)
+
+        self.assertEqual(self.directory / '1.xml', store.finder.find_by_number('平成二十九年法律第二号'))
+        with self.assertRaises(ValueError):
+            store.get(law_num='平成二十九年法律第四号')
+        with self.assertRaises(ValueError):
+            store.get(law_num='平成二十九年法律第三号')
+
+    def test_evict(self):
+        store = LawStore(self.directory, max_size=int(self.size * 2.5))
+        store.get(law_num='平成二十九年法律第一号')
+        store.get(law_num='平成二十九年法律第二号')
+        store.get(law_num='平成二十九年法律第一号')
+        store.get(law_title=LawDocument.from_xml_fp(self.directory / '2.xml').meta['LawTitle'])
+        self.assertEqual(2, len(store))
+        self.assertIn('平成二十九年法律第一号', store)
+        self.assertNotIn('平成二十九年法律第二号', store)
+
+    def test_get_finder(self):
+        store = LawStore(self.directory)
+        expected = list(map(str, store.get(law_num='平成二十九年法律第一号').nodes))
+        finder = store.get_finder(law_num='平成二十九年法律第一号')
+        apply_replace(parse_action_text('第一条第一項中「重要な食料資源」を「大切な食料資源」に改める'), finder)
+        self.assertNotEqual(expected, list(map(str, finder.nodes)))
+        self.assertEqual(expected, list(map(str, store.get(law_num='平成二十九年法律第一号').nodes)))
@@ -0,0 +1,21 @@
+from unittest import TestCase, skipIf
+
+from lawhub.law import LawDocument
+from lawhub.xmlbackend import get_backend, available_backends, ElementTreeBackend, LxmlBackend
+
+
+class TestXmlBackend(TestCase):
+    def test_get_backend(self):
+        self.assertTrue(isinstance(get_backend('etree'), ElementTreeBackend))
+        self.assertTrue(get_backend().name in available_backends())
+        with self.assertRaises(ValueError):
+            get_backend('unknown')
+
+    @skipIf('lxml' not in available_backends(), 'lxml is not installed')
+    def test_lxml_backend(self):
+        fp = './resource/egov.xml'
+        expected = LawDocument.from_xml_fp(fp, ElementTreeBackend())
+        actual = LawDocument.from_xml_fp(fp, LxmlBackend())
+        self.assertEqual(expected.meta, actual.meta)
+        self.assertEqual([node.serialize() for node in expected.nodes], [node.serialize() for node in actual.nodes])
+        self.assertEqual(list(map(str, expected.nodes)), list(map(str, actual.nodes)))
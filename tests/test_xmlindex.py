@@ -0,0 +1,151 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from lawhub.law import LawDocument, LawNodeFinder, Article, Paragraph, parse_article_xml_fp, parse_xml_entry, build_address_index
+from lawhub.query import Query
+from lawhub.xmlbackend import available_backends, get_backend
+from lawhub.xmlindex import LawXmlIndex
+
+
+class TestLawXmlIndex(TestCase):
+    def setUp(self):
+        self.tmp_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_directory.name)
+
+    def tearDown(self):
+        self.tmp_directory.cleanup()
+
+    def test_build(self):
+        fp = './resource/egov.xml'
+        index = LawXmlIndex.build(fp)
+        articles = [node for node in LawDocument.from_xml_fp(fp).nodes if isinstance(node, Article)]
+        self.assertEqual([node.number for node in articles], [entry.num for entry in index.entries])
+        data = Path(fp).read_bytes()
+        for entry in index.entries:
+            self.assertTrue(data[entry.start:entry.end].startswith(b'<Article '))
+            self.assertTrue(data[entry.start:entry.end].endswith(b'</Article>'))
+
+    def test_nested(self):
+        fp = self.directory / 'law.xml'
+        fp.write_text('<Law><LawNum>1</LawNum><LawBody><LawTitle>t</LawTitle><MainProvision>'
+                      '<Chapter Num="1"><ChapterTitle>第一章</ChapterTitle>'
+                      '<Article Num="1"><ArticleTitle>第一条</ArticleTitle><Paragraph Num="1"><ParagraphNum/>'
+                      '<ParagraphSentence><Sentence>本文</Sentence></ParagraphSentence></Paragraph></Article>'
+                      '<Article Num="2"><ArticleTitle>第二条</ArticleTitle></Article></Chapter></MainProvision>'
+                      '<SupplProvision><Article Num="3"><ArticleTitle>第三条</ArticleTitle></Article></SupplProvision>'
+                      '</LawBody></Law>')
+        index = LawXmlIndex.build(fp)
+        self.assertEqual([('Chapter', '1', -1, '第一章'), ('Article', '1', 0, '第一条'), ('Article', '2', 0, '第二条')],
+                         [(entry.tag, entry.num, entry.parent, entry.title) for entry in index.entries])
+        self.assertEqual('<Article Num="2"><ArticleTitle>第二条</ArticleTitle></Article>', LawXmlIndex.read(fp, index.find_article('2')).decode('utf-8'))
+        with self.assertRaises(KeyError):
+            index.find_article('3')  # not in MainProvision
+
+        chapter = parse_xml_entry(fp, index.entries[0])
+        self.assertEqual(str(LawDocument.from_xml_fp(fp).nodes[0]), str(chapter))
+
+    def test_empty_element(self):
+        fp = self.directory / 'law.xml'
+        fp.write_text('<Law><LawBody><MainProvision><Chapter Num="1"><ChapterTitle/><Article Num="1"/></Chapter ></MainProvision></LawBody></Law>')
+        index = LawXmlIndex.build(fp)
+        self.assertEqual(b'<Chapter Num="1"><ChapterTitle/><Article Num="1"/></Chapter >', LawXmlIndex.read(fp, index.entries[0]))
+        self.assertEqual(b'<Article Num="1"/>', LawXmlIndex.read(fp, index.entries[1]))
+
+    def test_parse_article_xml_fp(self):
+        fp = './resource/egov.xml'
+        expected = {node.number: node for node in LawDocument.from_xml_fp(fp).nodes}
+        index = LawXmlIndex.build(fp)
+        for backend in available_backends():
+            for number in ['1', '10', '18']:
+                article = parse_article_xml_fp(fp, number, index, get_backend(backend))
+                self.assertEqual(expected[number].serialize(), article.serialize())
+
+    def test_save_and_load(self):
+        fp = self.directory / 'egov.xml'
+        fp.write_bytes(Path('./resource/egov.xml').read_bytes())
+        index_directory = self.directory / 'index'
+        index_fp = LawXmlIndex.index_fp(fp, index_directory)
+        self.assertIn(index_directory, index_fp.parents)
+        index = LawXmlIndex.load_or_build(fp, index_directory)
+        self.assertTrue(index_fp.exists())  # saved on build
+        self.assertEqual(LawXmlIndex.build(fp).entries, LawXmlIndex.load(index_fp).entries)
+        self.assertEqual(index.entries, LawXmlIndex.load_or_build(fp, index_directory).entries)
+
+        # rebuild outdated index
+        mtime = os.stat(fp).st_mtime_ns
+        fp.write_bytes(fp.read_bytes().replace(b'<Article Num="1">', b'<Article Num="1" >'))
+        os.utime(fp, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+        self.assertEqual(LawXmlIndex.build(fp).entries, LawXmlIndex.load_or_build(fp, index_directory).entries)
+        self.assertNotEqual(index.entries, LawXmlIndex.load_or_build(fp, index_directory).entries)
+
+        # rebuild index of the file with the same size
+        data = fp.read_bytes().replace(b'<Article Num="1" >', b'<Article Num="1">').replace(b'<Article Num="18">', b'<Article Num="18"  >')
+        fp.write_bytes(data)
+        os.utime(fp, ns=(mtime + 2 * 10 ** 9, mtime + 2 * 10 ** 9))
+        self.assertEqual(len(data), LawXmlIndex.load(index_fp).size)
+        index = LawXmlIndex.load_or_build(fp, index_directory)
+        self.assertEqual(LawXmlIndex.build(fp).entries, index.entries)
+        self.assertTrue(data[index.find_article('5').start:].startswith(b'<Article Num="5">'))
+
+        # keep the index if only mtime is changed
+        os.utime(fp, ns=(mtime + 3 * 10 ** 9, mtime + 3 * 10 ** 9))
+        self.assertEqual(index.entries, LawXmlIndex.load_or_build(fp, index_directory).entries)
+        self.assertEqual(mtime + 3 * 10 ** 9, LawXmlIndex.load(index_fp).mtime)
+
+    def test_titles(self):
+        fp = self.directory / 'law.xml'
+        fp.write_text('<Law><LawBody><MainProvision><Paragraph Num="1"><ParagraphNum/><ParagraphSentence><Sentence>本文</Sentence></ParagraphSentence></Paragraph>'
+                      '<Article Num="1"><ArticleCaption>（目的\t&amp;）</ArticleCaption><ArticleTitle>第一条<Ruby>a</Ruby>b</ArticleTitle></Article>'
+                      '<Article Num="2"><ArticleTitle/></Article></MainProvision></LawBody></Law>')
+        index = LawXmlIndex.build(fp)
+        self.assertEqual([('Paragraph', '', ''), ('Article', '第一条', '（目的\t&）'), ('Article', '', '')],
+                         [(entry.tag, entry.title, entry.caption) for entry in index.entries])
+        index.save(self.directory / 'law.idx')
+        self.assertEqual(index.entries, LawXmlIndex.load(self.directory / 'law.idx').entries)
+
+    def test_from_xml_index(self):
+        fp = './resource/egov.xml'
+        expected = LawDocument.from_xml_fp(fp)
+        index = LawXmlIndex.build(fp)
+        for backend in available_backends():
+            document = LawDocument.from_xml_index(fp, index, get_backend(backend))
+            self.assertEqual(expected.meta, document.meta)
+            self.assertTrue(all(node.is_lazy() for node in document.nodes))
+
+            finder = LawNodeFinder(document.nodes)
+            self.assertEqual(expected.nodes[1].children[0].sentence, finder.find(Query.from_text('第二条第一項'))[0].sentence)
+            self.assertFalse(document.nodes[1].is_lazy())
+            self.assertTrue(document.nodes[2].is_lazy())  # not read as not visited
+            self.assertIsInstance(finder.find(Query.from_text('第一項'))[0], Paragraph)
+            self.assertFalse(document.nodes[2].is_lazy())
+
+            self.assertEqual(list(map(str, expected.nodes)), list(map(str, document.nodes)))
+            self.assertEqual([node.serialize() for node in expected.nodes], [node.serialize() for node in document.nodes])
+            self.assertEqual([node.digest() for node in expected.nodes], [node.digest() for node in document.nodes])
+            self.assertEqual(build_address_index(expected.nodes).keys(),
+                             build_address_index(LawDocument.from_xml_index(fp, index).nodes).keys())
+
+    def test_from_xml_index_nested(self):
+        fp = self.directory / 'law.xml'
+        fp.write_text('<Law><LawNum>1</LawNum><LawBody><LawTitle>t</LawTitle><MainProvision>'
+                      '<Chapter Num="1"><ChapterTitle>第一章</ChapterTitle><Section Num="1"><SectionTitle>第一節</SectionTitle>'
+                      '<Article Num="1"><ArticleTitle>第一条</ArticleTitle><Paragraph Num="1"><ParagraphNum/>'
+                      '<ParagraphSentence><Sentence>本文</Sentence></ParagraphSentence></Paragraph></Article></Section>'
+                      '<Article Num="2"><ArticleCaption>（見出し）</ArticleCaption><ArticleTitle>第二条</ArticleTitle></Article></Chapter>'
+                      '<Paragraph Num="1"><ParagraphNum/><ParagraphSentence><Sentence>附属</Sentence></ParagraphSentence></Paragraph>'
+                      '</MainProvision></LawBody></Law>')
+        expected = LawDocument.from_xml_fp(fp)
+        document = LawDocument.from_xml_index(fp, LawXmlIndex.build(fp))
+        self.assertEqual([node.serialize() for node in expected.nodes], [node.serialize() for node in document.nodes])
+
+        # byte ranges of the index are invalid once the file is modified
+        document = LawDocument.from_xml_index(fp, LawXmlIndex.build(fp))
+        mtime = os.stat(fp).st_mtime_ns
+        fp.write_text(fp.read_text().replace('本文', '本文を改める'))
+        os.utime(fp, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+        article = document.nodes[0].children[0].children[0]
+        with self.assertRaises(ValueError):
+            _ = article.children
+        self.assertTrue(article.is_lazy())
@@ -2,13 +2,16 @@
 
 import argparse
 import glob
+import json
 import logging
 from pathlib import Path
 
 from tqdm import tqdm
 
-from lawhub.constants import LAWHUB_ROOT, LOG_DATE_FORMAT, LOG_FORMAT
-from lawhub.law import parse_xml_fp, save_law_tree, extract_law_meta
+from lawhub.cache import get_default_cache
+from lawhub.constants import LAWHUB_DATA, LAWHUB_ROOT, LOG_DATE_FORMAT, LOG_FORMAT
+from lawhub.law import LawDocument, Article, law_tree_digest, save_law_tree
+from lawhub.lawtree import FlatLawTree, LawCorpusWriter
 
 LOGGER = logging.getLogger('update_lawhub')
 
@@ -18,6 +21,8 @@ class FileManager:
     target_directory = LAWHUB_ROOT / 'lawhub'
     source_pattern = f'{source_directory}/*/*.xml'
     target_pattern = f'{target_directory}/*/*.txt'
+    digest_fp = LAWHUB_DATA / 'lawhub_digest.json'  # digests of laws and articles at the last update
+    corpus_fp = LAWHUB_DATA / 'corpus.bin'  # all parsed laws for lawhub.lawtree.LawCorpus
 
     def __init__(self, disable_tqdm=False):
         self.disable_tqdm = disable_tqdm
@@ -25,6 +30,7 @@ class FileManager:
         LOGGER.info(f'found {len(self.source_fps)} source xml files under {self.source_directory}')
         self.target_fps = set([Path(fp) for fp in glob.glob(self.target_pattern)])
         LOGGER.info(f'found {len(self.target_fps)} target xml files under {self.target_directory}')
+        self.digests = dict()  # relative path of source file -> {'digest': hex, 'articles': {Num: hex}}
 
     def stot(self, sfp):
         """
@@ -48,31 +54,83 @@ class FileManager:
 
     def copy_source_files(self):
         """
-        Copy source files to target directory
+        Copy source files to target directory, and save parsed laws to corpus file
         """
 
         LOGGER.info(f'start copying source files')
         count = 0
-        for sfp in tqdm(sorted(self.source_fps), disable=self.disable_tqdm):
-            try:
-                meta = extract_law_meta(sfp)
-                nodes = parse_xml_fp(sfp)
-                tfp = self.stot(sfp)
-                tfp.parent.mkdir(parents=True, exist_ok=True)
-                save_law_tree(meta['LawTitle'], nodes, tfp)
-            except Exception as e:
-                LOGGER.error(f'failed to copy {sfp}: {e}')
-                continue
-            self.target_fps.add(tfp)
-            LOGGER.debug(f'copied {sfp} to {tfp}')
-            count += 1
+        cache = get_default_cache()
+        self.corpus_fp.parent.mkdir(parents=True, exist_ok=True)
+        with LawCorpusWriter(self.corpus_fp) as writer:
+            for sfp in tqdm(sorted(self.source_fps), disable=self.disable_tqdm):
+                key = str(sfp.relative_to(self.source_directory))
+                try:
+                    document = LawDocument.from_xml_fp(sfp, cache=cache)
+                    tfp = self.stot(sfp)
+                    tfp.parent.mkdir(parents=True, exist_ok=True)
+                    save_law_tree(document.meta['LawTitle'], document.nodes, tfp)
+                    self.digests[key] = compute_digests(document.nodes)
+                    writer.add(key, document.meta, FlatLawTree.from_nodes(document.nodes))
+                except Exception as e:
+                    LOGGER.error(f'failed to copy {sfp}: {e}')
+                    continue
+                self.target_fps.add(tfp)
+                LOGGER.debug(f'copied {sfp} to {tfp}')
+                count += 1
         LOGGER.info(f'copied total {count} source files, now total {len(self.target_fps)} target files exist')
+        LOGGER.info(f'saved {count} parsed laws to {self.corpus_fp}')
+        if cache:
+            LOGGER.info(f'loaded {cache.hit_count} files from cache and parsed {cache.miss_count} files')
+
+    def report_changes(self):
+        """
+        Compare digests with the last update to find changed laws and articles, and save current digests
+        """
+
+        prev_digests = dict()
+        if self.digest_fp.exists():
+            with open(self.digest_fp) as f:
+                prev_digests = json.load(f)
+        added = set(self.digests) - set(prev_digests)
+        removed = set(prev_digests) - set(self.digests)
+        changed = 0
+        changed_articles = 0
+        for key in sorted(set(self.digests) & set(prev_digests)):
+            curr, prev = self.digests[key], prev_digests[key]
+            if curr['digest'] == prev['digest']:
+                continue
+            changed += 1
+            numbers = [num for num in curr['articles'] if prev['articles'].get(num) != curr['articles'][num]]
+            numbers += [num for num in prev['articles'] if num not in curr['articles']]
+            changed_articles += len(numbers)
+            LOGGER.debug(f'{key} changed at Article {",".join(numbers) if numbers else "(none)"}')
+        LOGGER.info(f'found {len(added)} added, {len(removed)} removed and {changed} changed laws ({changed_articles} articles)')
+
+        self.digest_fp.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.digest_fp, 'w') as f:
+            json.dump(self.digests, f, ensure_ascii=False)
+
+
+def compute_digests(nodes):
+    """
+    法令全体と各条のdigestを返す（条の位置が変わっても内容が同じなら変更とはみなさない）
+    """
+    articles = dict()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Article):
+            articles.setdefault(node.number, node.digest().hex())
+        else:
+            stack.extend(node.children)
+    return {'digest': law_tree_digest(nodes).hex(), 'articles': articles}
 
 
 def main(disable_tqdm):
     file_manager = FileManager(disable_tqdm)
     file_manager.remove_target_files()
     file_manager.copy_source_files()
+    file_manager.report_changes()
 
 
 if __name__ == '__main__':
@@ -11,6 +11,7 @@ from tqdm import tqdm
 
 from lawhub.constants import LAWHUB_DATA, LAWHUB_ROOT, LOG_DATE_FORMAT, LOG_FORMAT
 from lawhub.law import extract_law_meta
+from lawhub.xmlindex import LawXmlIndex, INDEX_SUFFIX, INDEX_DIRECTORY
 
 LOGGER = logging.getLogger('update_lawhub_xml')
 
@@ -22,6 +23,8 @@ class FileManager:
     index_fp = target_directory / 'index.tsv'
     source_pattern = f'{source_directory}/*/*/*.xml'  # {zip_id}/{egov_id}/{egov_id}.xml
     target_pattern = f'{target_directory}/*/*.xml'  # {year}/{law_num}.xml
+    index_pattern = f'{INDEX_DIRECTORY}/lawhub-xml/*/*{INDEX_SUFFIX}'  # {year}/{law_num}.idx
+    legacy_index_pattern = f'{target_directory}/*/*{INDEX_SUFFIX}'  # indexes used to be saved in lawhub-xml
 
     def __init__(self, disable_tqdm=False):
         self.disable_tqdm = disable_tqdm
@@ -53,6 +56,8 @@ class FileManager:
             tfp.unlink()
             self.target_fps.remove(tfp)
             count += 1
+        for ifp in glob.glob(self.index_pattern) + glob.glob(self.legacy_index_pattern):
+            Path(ifp).unlink()
         LOGGER.info(f'removed total {count} target files, now total {len(self.target_fps)} target files exist')
 
     def copy_source_files(self):
@@ -94,12 +99,29 @@ class FileManager:
         df.to_csv(self.index_fp, index=False, sep='\t')
         LOGGER.info(f'created index file with {len(self.target_fps)} files :{self.index_fp}')
 
+    def create_xml_index_files(self):
+        """
+        Create {law_num}.idx for each target file under LAWHUB_DATA, which stores byte offsets of Articles (see lawhub.xmlindex)
+        """
+
+        LOGGER.info(f'start creating xml index files')
+        count = 0
+        for tfp in tqdm(sorted(self.target_fps), disable=self.disable_tqdm):
+            try:
+                LawXmlIndex.build(tfp).save(LawXmlIndex.index_fp(tfp))
+            except Exception as e:
+                LOGGER.error(f'failed to create xml index of {tfp}: {e}')
+                continue
+            count += 1
+        LOGGER.info(f'created total {count} xml index files')
+
 
 def main(disable_tqdm):
     file_manager = FileManager(disable_tqdm)
     file_manager.remove_target_files()
     file_manager.copy_source_files()
     file_manager.create_index_file()
+    file_manager.create_xml_index_files()
 
 
 if __name__ == '__main__':